@@ -0,0 +1,47 @@
+import sphero_discovery
+import sphero_aim
+import sys
+
+# Connect to the Sphero Minis given on the command line, or else to every one found nearby:
+if len(sys.argv) < 2:
+    MACs = [device.addr for device in sphero_discovery.discover()]
+    if not MACs:
+        print("Usage: 'python [this_file_name.py] [sphero MAC address] [sphero MAC address] ...'")
+        print("eg f2:54:32:9d:68:a4 e1:2b:77:03:5c:10")
+        print("No Sphero Mini found by scanning (on Linux, scanning needs sudo)")
+        exit(1)
+else:
+    MACs = sys.argv[1:]
+
+spheros, failed = sphero_discovery.connectAll(MACs, verbosity = 1)
+print("Connected to {} of {} spheros".format(len(spheros), len(MACs)))
+if not spheros:
+    exit(1)
+
+# Start streaming yaw while all the robots face the same direction. This becomes the common reference.
+input("Place all spheros facing the same direction, then press Enter")
+for sphero in spheros.values():
+    sphero.configureSensorMask(IMU_yaw=True)
+    sphero.configureSensorStream()
+
+input("Move the spheros to their starting positions (in any orientation), then press Enter")
+
+# Aim all spheros at once:
+results = sphero_aim.alignHeadings(spheros.values())
+for MAC, sphero in spheros.items():
+    result = results[sphero]
+    if isinstance(result, Exception):
+        print("{}: aiming failed ({})".format(MAC, result))
+    else:
+        print("{}: residual error {:.1f} degrees after {:.1f}s".format(MAC, result["residual"], result["duration"]))
+
+# All spheros now share heading 0, so the same command drives them the same way:
+for sphero in spheros.values():
+    sphero.roll(50, 0)
+list(spheros.values())[0].wait(2) # Keep rolling for two seconds
+for sphero in spheros.values():
+    sphero.roll(0, 0)
+
+for sphero in spheros.values():
+    sphero.sleep()
+    sphero.disconnect()
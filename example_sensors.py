@@ -1,13 +1,18 @@
 import sphero_mini
+import sphero_discovery
 import sys
 
 if len(sys.argv) < 2:
-    print("Usage: 'python [this_file_name.py] [sphero MAC address]'")
-    print("eg f2:54:32:9d:68:a4")
-    print("On Linux, use 'sudo hcitool lescan' to find your Sphero Mini's MAC address")
-    exit(1)
-
-MAC = sys.argv[1] # Get MAC address from command line argument
+    devices = sphero_discovery.discover() # No MAC address given: use the nearest Sphero Mini instead
+    if not devices:
+        print("Usage: 'python [this_file_name.py] [sphero MAC address]'")
+        print("eg f2:54:32:9d:68:a4")
+        print("No Sphero Mini found by scanning (on Linux, scanning needs sudo)")
+        exit(1)
+    MAC = devices[0].addr
+    print("Found", devices[0].name, "at", MAC)
+else:
+    MAC = sys.argv[1] # Get MAC address from command line argument
 
 # Connect:
 sphero = sphero_mini.sphero_mini(MAC, verbosity = 1)
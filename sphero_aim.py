@@ -0,0 +1,137 @@
+'''
+Automatic aiming (heading calibration) using the streamed IMU_yaw angle.
+
+Manual aiming turns off stabilization, lights the back LED and waits for a person to turn the sphero by hand
+before calling resetHeading(). alignHeading() does this without a person. It watches IMU_yaw while
+turning the sphero on the spot with roll(0, heading) commands. Once the yaw matches a reference angle, it
+calls resetHeading(), so that heading 0 points in the reference direction.
+
+IMU_yaw is measured from the direction the sphero faced when its sensor stream started. To give a fleet a
+common zero heading, place the robots facing the same way (e.g. in their charging rack) when configuring the
+sensor stream. They can then be moved anywhere and re-aligned with alignHeadings(), which calibrates
+all robots in parallel:
+
+    results = alignHeadings(spheros)
+    for sphero, result in results.items():
+        print(result["residual"]) # degrees left between the new zero heading and the reference
+
+Each robot first turns to two drive headings, to learn how its drive headings map onto its yaw readings
+(the two turn in opposite directions on some firmware). It then turns towards the reference in a few
+correcting steps, each waiting only until the yaw has settled. The heading is reset only at the end, and the
+yaw is checked to be unaffected by the reset.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import time
+import sys
+
+def wrapAngle(angle):
+    '''
+    Wrap an angle in degrees to the range -180 to +180
+    '''
+    return (angle + 180.0) % 360.0 - 180.0
+
+def settledYaw(sphero, settle_time = 0.25, tolerance = 1.0, timeout = 2.0):
+    '''
+    Wait until IMU_yaw has stayed within +/- tolerance degrees for settle_time seconds (or until timeout
+    seconds have passed), and return it. Raises RuntimeError if no yaw sample arrives before the timeout.
+    '''
+    start = time.monotonic()
+    first = None # time of the first yaw reading
+    history = deque()
+    while True:
+        sphero.wait(0.02) # lets notifications update sphero.IMU_yaw
+        now = time.monotonic()
+        yaw = getattr(sphero, "IMU_yaw", None) # only set once the first sensor packet has arrived
+        if yaw is None:
+            if now - start > timeout:
+                raise RuntimeError("No IMU_yaw sample received within {}s".format(timeout))
+            continue
+        if first is None:
+            first = now
+        history.append((now, yaw))
+        while now - history[0][0] > settle_time:
+            history.popleft()
+        if now - first >= settle_time and all(abs(wrapAngle(y - yaw)) <= tolerance for _, y in history):
+            return yaw
+        if now - start > timeout:
+            return yaw
+
+def alignHeading(sphero, reference_yaw = 0.0, tolerance = 2.0, max_iterations = 4, calibration_angle = 45):
+    '''
+    Turn the sphero until its yaw matches reference_yaw (degrees), then make that its zero heading.
+
+    tolerance: stop correcting once within this many degrees of the reference
+    max_iterations: number of correcting turns after the calibration turns
+    calibration_angle: difference between the two calibration headings (degrees)
+
+    Returns a dictionary with:
+    - 'residual': remaining difference between the reference and the new zero heading (degrees)
+    - 'iterations': number of correcting turns made
+    - 'gain': measured yaw change per degree of drive heading (about +1 or -1)
+    - 'duration': time taken (seconds)
+    '''
+    start = time.monotonic()
+    if "IMU_yaw" not in sphero.configured_sensors:
+        # Starting the stream here would measure yaw from wherever the sphero happens to face now, so the
+        # reference would mean nothing. The stream must already run from the common starting orientation.
+        raise RuntimeError("IMU_yaw is not streamed: call configureSensorMask(IMU_yaw = True) and "
+                           "configureSensorStream() while the spheros face the same direction")
+
+    sphero.stabilization(True) # needed for the sphero to hold and turn to a heading
+
+    # The heading is only reset once, at the end: resetting it first might also re-zero the streamed yaw
+    # (as on other Sphero firmware), which would lose the common reference. Until then, drive headings are
+    # relative to the sphero's previous zero heading, wherever that is, so the first two turns measure how
+    # drive headings map onto yaw readings.
+    sphero.roll(0, 0)
+    base = settledYaw(sphero)
+    heading = calibration_angle
+    sphero.roll(0, heading)
+    yaw = settledYaw(sphero)
+    gain = wrapAngle(yaw - base) / calibration_angle
+    if not 0.5 < abs(gain) < 1.5:
+        raise RuntimeError("Calibration turn of {} degrees changed yaw by {:.1f} degrees".format(
+            calibration_angle, wrapAngle(yaw - base)))
+
+    iterations = 0
+    error = wrapAngle(reference_yaw - yaw)
+    while abs(error) > tolerance and iterations < max_iterations:
+        heading = int(round(heading + error / gain)) % 360
+        sphero.roll(0, heading)
+        yaw = settledYaw(sphero)
+        error = wrapAngle(reference_yaw - yaw)
+        iterations += 1
+
+    sphero.resetHeading() # the sphero now faces (within the residual) the reference direction
+    after = settledYaw(sphero)
+    if abs(wrapAngle(after - yaw)) > max(tolerance, 5.0):
+        raise RuntimeError("resetHeading() moved IMU_yaw from {:.1f} to {:.1f} degrees: this firmware re-zeroes "
+                           "yaw with the heading, so there is no common reference left".format(yaw, after))
+    return {"residual": error, "iterations": iterations, "gain": gain, "duration": time.monotonic() - start}
+
+def alignHeadings(spheros, reference_yaw = 0.0, max_workers = None, **kwargs):
+    '''
+    Align the zero headings of several spheros at the same time (see alignHeading()).
+
+    reference_yaw: one angle for all spheros, or a dictionary mapping each sphero to its own reference
+    kwargs: passed on to alignHeading()
+
+    Returns a dictionary mapping each sphero to its result dictionary, or to the exception raised while
+    aligning it.
+    '''
+    spheros = list(spheros)
+    if not spheros:
+        return {}
+
+    def align(sphero):
+        reference = reference_yaw[sphero] if isinstance(reference_yaw, dict) else reference_yaw
+        try:
+            return alignHeading(sphero, reference, **kwargs)
+        except Exception as e:
+            print("Aiming failed:", e, file=sys.stderr)
+            return e
+
+    with ThreadPoolExecutor(max_workers = max_workers or len(spheros)) as executor:
+        return dict(zip(spheros, executor.map(align, spheros)))
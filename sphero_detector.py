@@ -0,0 +1,213 @@
+'''
+Host-side motion event detection for the Sphero Mini. Requires numpy (pip install numpy --user).
+
+The sphero's own collision detection (configureCollisionDetection()) is unreliable and ignores its speed
+settings. MotionDetector is an alternative that watches the streamed accelerometer values instead, and emits
+four kinds of events:
+
+- "collision": a sharp horizontal impact (high jerk together with high horizontal acceleration)
+- "pick_up": sustained upward acceleration
+- "shake": repeated reversals of the acceleration within a short window
+- "free_fall": acceleration magnitude close to zero for a while (dropped or thrown)
+
+Every new sample is checked against a sliding window of recent samples with numpy array operations. Usage:
+
+    def on_event(event):
+        print(event["type"], event["magnitude"], event["latency"])
+
+    sphero.configureSensorMask(IMU_acc_x=True, IMU_acc_y=True, IMU_acc_z=True)
+    sphero.configureSensorStream()
+    detector = MotionDetector(callback = on_event, sensitivity = 1.5)
+    detector.attach(sphero)
+
+The accelerometer is assumed to read in g, with z pointing up (about [0, 0, 1] when the sphero sits still).
+'''
+
+import numpy as np
+import time
+
+# Default thresholds. Sensitivity divides the amplitude thresholds (g, g/s), not the durations (s).
+defaultThresholds = {"collision_acc": 0.8,      # horizontal acceleration during an impact (g)
+                     "collision_jerk": 20.0,    # change of acceleration between samples (g/s)
+                     "pick_up_acc": 0.25,       # vertical acceleration above gravity (g)
+                     "pick_up_time": 0.1,       # ...sustained for this long (s)
+                     "shake_acc": 0.5,          # deviation of acceleration magnitude from 1 g counted as a swing (g)
+                     "shake_count": 6,          # number of swing reversals...
+                     "shake_time": 1.0,         # ...within this time (s)
+                     "free_fall_acc": 0.3,      # acceleration magnitude below this is weightless (g)
+                     "free_fall_time": 0.08}    # ...sustained for this long (s)
+
+amplitudeThresholds = ("collision_acc", "collision_jerk", "pick_up_acc", "shake_acc", "free_fall_acc")
+
+accChannels = ("IMU_acc_x", "IMU_acc_y", "IMU_acc_z")
+
+eventTypes = ("collision", "pick_up", "shake", "free_fall")
+
+class MotionDetector():
+    def __init__(self, callback = None, sensitivity = 1.0, dead_time = 0.5, capacity = 512, **thresholds):
+        '''
+        callback: function called with each event dictionary (see _emit())
+        sensitivity: scales all amplitude thresholds at once (2.0 = trigger on half the acceleration)
+        dead_time: ignore further events of the same type for this many seconds (avoids repeat triggering)
+        capacity: number of recent samples kept. Must cover the longest window (shake_time) at the stream's
+                sample rate.
+        thresholds: override any of defaultThresholds, e.g. collision_acc = 1.2
+        '''
+        for name in thresholds:
+            if name not in defaultThresholds:
+                raise ValueError("Unknown threshold '{}', expected one of {}".format(name, list(defaultThresholds)))
+        self.callback = callback
+        self.dead_time = dead_time
+        self.thresholds = dict(defaultThresholds, **thresholds)
+        self.setSensitivity(sensitivity)
+
+        # Every sample is written twice, capacity apart, so that the last `capacity` samples are always
+        # available in order as one contiguous slice (no copying or wrapping when evaluating the window)
+        self.capacity = capacity
+        self.t = np.zeros(2 * capacity)
+        self.acc = np.zeros((2 * capacity, 3))
+        self.count = 0
+        self.last_event = {name: -np.inf for name in eventTypes}
+        self.events = [] # every event emitted, in order
+        self.sphero = None
+
+    def setSensitivity(self, sensitivity):
+        self.sensitivity = sensitivity
+        self.active = {name: (value / sensitivity if name in amplitudeThresholds else value)
+                       for name, value in self.thresholds.items()}
+
+    def attach(self, sphero):
+        '''
+        Consume the sensor stream of a sphero_mini instance. The accelerometer must be streamed (call
+        configureSensorMask() first), otherwise ValueError is raised.
+        '''
+        missing = [name for name in accChannels if name not in sphero.configured_sensors]
+        if missing:
+            raise ValueError("MotionDetector needs the accelerometer streamed, but {} {} not configured (see "
+                             "configureSensorMask())".format(", ".join(missing), "is" if len(missing) == 1 else "are"))
+        self.sphero = sphero
+        sphero.addSensorListener(self.addSample)
+
+    def detach(self):
+        if self.sphero is not None:
+            self.sphero.removeSensorListener(self.addSample)
+            self.sphero = None
+
+    def addSample(self, sample):
+        '''
+        Check one decoded sample (see sphero_mini.addSensorListener()) for events
+        '''
+        t = sample.get("device_time", sample["timestamp"])
+        acc = [[sample[name] for name in accChannels]]
+        return self.process([t], acc, received = [sample["timestamp"]],
+                            transport_latency = [sample.get("latency") or 0.0])
+
+    def process(self, t, acc, received = None, transport_latency = None):
+        '''
+        Add a batch of N new samples and check each of them for events. Returns the list of events emitted.
+
+        t: sample times in seconds, shape (N,)
+        acc: [x, y, z] acceleration in g, shape (N, 3)
+        received: host time.monotonic() at which each sample arrived, used to measure detection latency
+                (defaults to now, i.e. latency excluding the transport)
+        transport_latency: estimated transport latency of each sample (seconds), added to the detection latency
+        '''
+        t = np.asarray(t, dtype = float)
+        acc = np.asarray(acc, dtype = float)
+        n = min(len(t), self.capacity) # a batch bigger than the window can only be checked in part
+        t, acc = t[-n:], acc[-n:]
+        detected_at = time.monotonic()
+        received = np.full(n, detected_at) if received is None else np.asarray(received, dtype = float)[-n:]
+        transport_latency = np.zeros(n) if transport_latency is None else np.asarray(transport_latency, dtype = float)[-n:]
+        self._append(t, acc)
+
+        # Ordered window ending with the new samples, reaching back only as far as the longest time window
+        # before the first new sample (plus one sample for the jerk), and the range of the new samples within it:
+        a = self.active
+        size = min(self.count, self.capacity)
+        end = self.count % self.capacity + self.capacity
+        lookback = max(a["shake_time"], a["pick_up_time"], a["free_fall_time"])
+        history = self.t[end - size:end - n]
+        size -= max(np.searchsorted(history, t[0] - lookback) - 1, 0)
+        wt, wacc = self.t[end - size:end], self.acc[end - size:end]
+        new = slice(size - n, size)
+
+        magnitude = np.linalg.norm(wacc, axis = 1)
+        horizontal = np.hypot(wacc[:, 0], wacc[:, 1])
+
+        # Collision: jerk and horizontal acceleration both high on the same sample
+        dt = np.diff(wt, prepend = -np.inf)
+        dt[dt <= 0] = np.inf # first sample, or out of order: no jerk estimate
+        jerk = np.linalg.norm(np.diff(wacc, axis = 0, prepend = wacc[:1]), axis = 1) / dt
+        collision = (jerk > a["collision_jerk"]) & (horizontal > a["collision_acc"])
+
+        # Pick up and free fall: condition held continuously for a minimum time
+        pick_up = self._sustained(wt, wacc[:, 2] - 1.0 > a["pick_up_acc"], a["pick_up_time"])
+        free_fall = self._sustained(wt, magnitude < a["free_fall_acc"], a["free_fall_time"])
+
+        # Shake: a reversal between swings above and below 1 g, which is at least the shake_count'th
+        # reversal within the last shake_time seconds
+        swing = np.sign(magnitude - 1.0) * (np.abs(magnitude - 1.0) > a["shake_acc"])
+        swing_idx = np.flatnonzero(swing)
+        flipped = np.zeros(size, dtype = bool)
+        if len(swing_idx) > 1:
+            flipped[swing_idx[1:][swing[swing_idx[1:]] != swing[swing_idx[:-1]]]] = True
+        reversals = np.cumsum(flipped)
+        window_start = np.searchsorted(wt, wt - a["shake_time"], side = "left")
+        shake = flipped & (reversals - np.where(window_start > 0, reversals[window_start - 1], 0) >= a["shake_count"])
+
+        candidates = {"collision": (collision, jerk),
+                      "pick_up": (pick_up, wacc[:, 2] - 1.0),
+                      "shake": (shake, np.abs(magnitude - 1.0)),
+                      "free_fall": (free_fall, magnitude)}
+        detected_at = time.monotonic()
+
+        events = []
+        for k in np.flatnonzero(np.any([flags[new] for flags, _ in candidates.values()], axis = 0)):
+            for name, (flags, magnitudes) in candidates.items():
+                if flags[new][k] and wt[new][k] - self.last_event[name] >= self.dead_time:
+                    self.last_event[name] = wt[new][k]
+                    events.append(self._emit(name, wt[new][k], float(magnitudes[new][k]),
+                                             detected_at - received[k] + transport_latency[k]))
+        return events
+
+    def latencyStats(self):
+        '''
+        Return (mean, maximum) detection latency in seconds over all events so far, or (None, None)
+        '''
+        if not self.events:
+            return None, None
+        latencies = [event["latency"] for event in self.events]
+        return sum(latencies) / len(latencies), max(latencies)
+
+    def _append(self, t, acc):
+        for ti, acci in zip(t, acc):
+            i = self.count % self.capacity
+            self.t[i] = self.t[i + self.capacity] = ti
+            self.acc[i] = self.acc[i + self.capacity] = acci
+            self.count += 1
+
+    def _sustained(self, t, condition, duration):
+        '''
+        For each sample, whether condition has held on every sample over at least the last duration seconds
+        '''
+        index = np.arange(len(t))
+        last_false = np.maximum.accumulate(np.where(condition, -1, index)) # most recent sample where it didn't hold
+        first_true = np.minimum(last_false + 1, len(t) - 1)
+        return condition & (t - t[first_true] >= duration)
+
+    def _emit(self, name, t, magnitude, latency):
+        '''
+        Events are dictionaries with:
+        - 'type': one of eventTypes
+        - 'time': time of the sample that triggered the event (device time if streamed, else host time)
+        - 'magnitude': jerk (g/s) for collisions, vertical acceleration above gravity (g) for pick up,
+                deviation from 1 g for shakes, acceleration magnitude (g) for free fall
+        - 'latency': seconds from the triggering movement to the event being emitted, including transport
+                latency when the device timer is streamed (see sphero_mini.ClockSync)
+        '''
+        event = {"type": name, "time": float(t), "magnitude": magnitude, "latency": float(latency)}
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+        return event
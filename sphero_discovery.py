@@ -0,0 +1,125 @@
+'''
+Discovery of nearby Sphero Minis, so that MAC addresses don't have to be looked up by hand.
+
+Scanning identifies Sphero Minis by their advertised name (which starts with "SM-") or by the advertised API
+service UUID. Results are cached for a while, so that repeated calls don't each wait for a new scan, and can
+be passed straight to connectAll() to bring up several robots at once:
+
+    devices = discover()                # [DiscoveredSphero(addr='f2:54:...', name='SM-A4B1', rssi=-48), ...]
+    spheros, failed = connectAll(devices, verbosity = 1)
+
+NOTE: on Linux, bluepy needs root privileges (or the cap_net_admin capability on bluepy-helper) to scan.
+Without them, a scan prints a warning and finds nothing, so programs can fall back to a MAC address given by hand.
+
+The bluetooth scanner is passed in to SpheroScanner, so a stand-in can replace bluepy's Scanner (e.g. for
+testing without hardware). It only needs a scan(timeout) method returning entries with addr and rssi
+attributes and a getValueText(adtype) method, like bluepy's ScanEntry.
+'''
+
+from bluepy.btle import Scanner, ScanEntry, BTLEException
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import threading
+import time
+import sys
+
+import sphero_mini
+
+serviceUUID = "00010001-574f-4f20-5370-6865726f2121" # advertised by the Sphero Mini (API V2 service)
+namePrefix = "SM-"
+
+DiscoveredSphero = namedtuple("DiscoveredSphero", ["addr", "name", "rssi", "seen"])
+
+class SpheroScanner():
+    def __init__(self, scanner = None, ttl = 30):
+        '''
+        scanner: bluetooth scanner to use (defaults to bluepy's Scanner)
+        ttl: seconds for which a device seen in a scan stays in the cache
+        '''
+        self.scanner = scanner if scanner is not None else Scanner()
+        self.ttl = ttl
+        self.cache = {} # address -> DiscoveredSphero
+        self.last_scan = None
+        self.lock = threading.Lock()
+
+    def scan(self, timeout = 3, refresh = False, min_rssi = None):
+        '''
+        Return the Sphero Minis in range, strongest signal first. A new scan lasting timeout seconds is only
+        run if refresh is True or the last scan is older than the cache ttl.
+
+        min_rssi: ignore devices with a weaker signal than this (dBm, e.g. -80)
+
+        If the scan fails (e.g. for lack of privileges), a warning is printed and only cached devices are returned.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            if refresh or self.last_scan is None or now - self.last_scan > self.ttl:
+                try:
+                    entries = self.scanner.scan(timeout)
+                except BTLEException as e:
+                    print("Bluetooth scan failed (on Linux, scanning needs sudo):", e, file=sys.stderr)
+                    entries = None # not a completed scan: try again on the next call
+                for entry in entries or []:
+                    name = entry.getValueText(ScanEntry.COMPLETE_LOCAL_NAME) or \
+                           entry.getValueText(ScanEntry.SHORT_LOCAL_NAME) or ""
+                    services = (entry.getValueText(ScanEntry.COMPLETE_128B_SERVICES) or "") + \
+                               (entry.getValueText(ScanEntry.INCOMPLETE_128B_SERVICES) or "")
+                    if name.startswith(namePrefix) or serviceUUID in services.lower():
+                        self.cache[entry.addr] = DiscoveredSphero(entry.addr, name, entry.rssi, time.monotonic())
+                if entries is not None:
+                    self.last_scan = time.monotonic()
+                    now = self.last_scan
+
+            # Drop devices that haven't been seen for a while:
+            self.cache = {addr: device for addr, device in self.cache.items() if now - device.seen <= self.ttl}
+
+            devices = [device for device in self.cache.values() if min_rssi is None or device.rssi >= min_rssi]
+        return sorted(devices, key = lambda device: device.rssi, reverse = True)
+
+    def clear(self):
+        with self.lock:
+            self.cache = {}
+            self.last_scan = None
+
+def connectAll(devices, max_workers = None, retries = 1, connect = sphero_mini.sphero_mini, **kwargs):
+    '''
+    Connect to several spheros at the same time. devices may be DiscoveredSphero entries or MAC addresses.
+    Connection attempts that fail are retried up to retries more times.
+
+    connect: function creating a connection from a MAC address (defaults to the sphero_mini class)
+    kwargs: passed on to connect (e.g. verbosity = 1)
+
+    Returns a tuple (spheros, failed) of dictionaries, mapping MAC address to the connected sphero_mini
+    instance, or to the exception of the last failed attempt, respectively.
+    '''
+    addresses = [device.addr if isinstance(device, DiscoveredSphero) else device for device in devices]
+    if not addresses:
+        return {}, {}
+
+    def attempt(addr):
+        for i in range(retries + 1):
+            try:
+                return connect(addr, **kwargs)
+            except Exception as e:
+                print("Connection to {} failed (attempt {}/{}): {}".format(addr, i + 1, retries + 1, e),
+                      file=sys.stderr)
+                error = e
+        return error
+
+    with ThreadPoolExecutor(max_workers = max_workers or len(addresses)) as executor:
+        results = dict(zip(addresses, executor.map(attempt, addresses)))
+
+    spheros = {addr: result for addr, result in results.items() if not isinstance(result, Exception)}
+    failed = {addr: result for addr, result in results.items() if isinstance(result, Exception)}
+    return spheros, failed
+
+default_scanner = None # created on first use, so that importing this module doesn't touch the bluetooth adapter
+
+def discover(timeout = 3, refresh = False, min_rssi = None):
+    '''
+    Scan for Sphero Minis with a shared, cached SpheroScanner (see SpheroScanner.scan())
+    '''
+    global default_scanner
+    if default_scanner is None:
+        default_scanner = SpheroScanner()
+    return default_scanner.scan(timeout, refresh, min_rssi)
@@ -0,0 +1,236 @@
+'''
+Sensor fusion for the Sphero Mini's streamed IMU values. Requires numpy (pip install numpy --user).
+
+The raw IMU_pitch/IMU_roll/IMU_yaw angles are noisy, and the gyroscope values drift when integrated. ImuFusion
+combines the two with a complementary filter: the integrated gyroscope rates are trusted over short time
+scales and the reported angles over long ones. It also removes gravity from the accelerometer readings to give
+an estimate of linear acceleration.
+
+Samples are collected from the sensor stream and processed in batches with numpy array operations, so the
+cost per sample stays small even at high sample rates. Usage:
+
+    sphero.configureSensorMask(IMU_pitch=True, IMU_roll=True, IMU_yaw=True,
+                               IMU_acc_x=True, IMU_acc_y=True, IMU_acc_z=True,
+                               IMU_gyro_x=True, IMU_gyro_y=True, IMU_gyro_z=True)
+    sphero.configureSensorStream()
+    fusion = ImuFusion()
+    fusion.attach(sphero)
+    ...
+    print(sphero.fused_yaw, sphero.lin_acc_x)
+
+Axis conventions are assumptions (the Sphero Mini's are undocumented): IMU_gyro_x/y/z are taken to be the
+pitch/roll/yaw rates in degrees per second, and the accelerometer to read [0, 0, 1] g when the sphero sits
+level. Since the sphero is usually upright, body rates are used directly as angle rates (small angle
+approximation).
+
+Run this file directly for a benchmark of samples processed per second.
+'''
+
+import numpy as np
+import time
+
+angleChannels = ("IMU_pitch", "IMU_roll", "IMU_yaw")
+gyroChannels = ("IMU_gyro_x", "IMU_gyro_y", "IMU_gyro_z")   # pitch, roll and yaw rates respectively
+accChannels = ("IMU_acc_x", "IMU_acc_y", "IMU_acc_z")
+fusedChannels = ("fused_pitch", "fused_roll", "fused_yaw")
+linearAccChannels = ("lin_acc_x", "lin_acc_y", "lin_acc_z")
+
+class ImuFusion():
+    def __init__(self, alpha = 0.98, batch_size = 16, max_delay = 0.05, max_dt = 0.5, chunk_size = 256):
+        '''
+        alpha: weight of the integrated gyroscope against the reported angles at each sample (above 0, up to 1).
+                Higher values smooth more, but follow slow changes of the reported angles more slowly.
+        batch_size: number of samples collected before the filter is run
+        max_delay: run the filter early if the oldest collected sample is older than this (seconds), to bound
+                the added latency at low sample rates
+        max_dt: longest time step integrated between two samples (seconds); longer gaps in the stream are
+                clipped to this
+        chunk_size: largest number of samples solved in one array operation. Smaller alphas use shorter chunks,
+                so that alpha**-n stays representable (see chunkLength()).
+        '''
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be above 0 and at most 1, not {}".format(alpha))
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_dt = max_dt
+        self.chunk_size = chunk_size
+
+        self.sphero = None
+        self.listeners = [] # functions called with the result dictionary of every batch (see update())
+        self.buffer = []
+        self.reset()
+
+    def reset(self):
+        self.angles = None # current filtered [pitch, roll, yaw] in degrees (yaw is unwrapped, not limited to +/-180)
+        self.last_time = None
+        self.samples_processed = 0
+
+    def attach(self, sphero):
+        '''
+        Consume the sensor stream of a sphero_mini instance and publish the results as attributes of it
+        (fused_pitch, fused_roll, fused_yaw in degrees, limited to +/-180, and lin_acc_x, lin_acc_y, lin_acc_z in g)
+        '''
+        self.sphero = sphero
+        sphero.addSensorListener(self.addSample)
+
+    def detach(self):
+        if self.sphero is not None:
+            self.sphero.removeSensorListener(self.addSample)
+            self.flush()
+            self.sphero = None
+
+    def addListener(self, callback):
+        self.listeners.append(callback)
+
+    def addSample(self, sample):
+        '''
+        Collect one decoded sample (see sphero_mini.addSensorListener()) and run the filter once a batch is full
+        '''
+        self.buffer.append(sample)
+        if len(self.buffer) >= self.batch_size or \
+           sample["timestamp"] - self.buffer[0]["timestamp"] >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        '''
+        Run the filter over all collected samples
+        '''
+        if not self.buffer:
+            return None
+        samples, self.buffer = self.buffer, []
+
+        t = np.array([s.get("device_time", s["timestamp"]) for s in samples])
+        angles = self._channels(samples, angleChannels)
+        gyro = self._channels(samples, gyroChannels)
+        acc = self._channels(samples, accChannels)
+        result = self.update(t, angles, gyro, acc)
+
+        if self.sphero is not None:
+            latest = {}
+            if result["angles"] is not None:
+                latest.update(zip(fusedChannels, (result["angles"][-1] + 180.0) % 360.0 - 180.0)) # same range as IMU_yaw
+            if result["linear_acc"] is not None:
+                latest.update(zip(linearAccChannels, result["linear_acc"][-1]))
+            for name, value in latest.items():
+                setattr(self.sphero, name, float(value))
+        for listener in self.listeners:
+            listener(result)
+        return result
+
+    def update(self, t, angles = None, gyro = None, acc = None):
+        '''
+        Advance the filter over a batch of N samples. All inputs are numpy arrays:
+
+        t: sample times in seconds, shape (N,)
+        angles: reported [pitch, roll, yaw] in degrees, shape (N, 3), or None if not streamed
+        gyro: [pitch, roll, yaw] rates in degrees per second, shape (N, 3), or None if not streamed
+        acc: [x, y, z] acceleration in g, shape (N, 3), or None if not streamed
+
+        Returns a dictionary with the times, the filtered angles (N, 3) and the linear acceleration (N, 3)
+        (None where the inputs don't allow an estimate).
+        '''
+        t = np.asarray(t, dtype = float)
+        n = len(t)
+        dt = np.diff(t, prepend = t[0] if self.last_time is None else self.last_time)
+        dt = np.clip(dt, 0.0, self.max_dt)
+
+        if angles is not None:
+            angles = np.unwrap(np.asarray(angles, dtype = float), period = 360.0, axis = 0)
+            if self.angles is not None: # continue the unwrapping from the current state
+                angles += 360.0 * np.round((self.angles - angles[0]) / 360.0)
+
+        if gyro is None and angles is None:
+            fused = None
+        elif gyro is None:
+            fused = angles # nothing to fuse with
+        else:
+            step = np.asarray(gyro, dtype = float) * dt[:, None] # integrated rate over each time step
+            state = self.angles
+            if state is None:
+                state = angles[0] if angles is not None else np.zeros(3)
+            if angles is None:
+                fused = state + np.cumsum(step, axis = 0) # gyroscope only
+            else:
+                # x[k] = a*(x[k-1] + step[k]) + (1-a)*angles[k], solved for the whole chunk at once:
+                # x[k] = a**k * (x[0] + sum(a**-j * u[j] for j <= k)), with u[j] = a*step[j] + (1-a)*angles[j]
+                a = self.alpha
+                u = a * step + (1 - a) * angles
+                fused = np.empty_like(u)
+                chunk = self.chunkLength()
+                for start in range(0, n, chunk):
+                    end = min(start + chunk, n)
+                    powers = a ** np.arange(1, end - start + 1)[:, None]
+                    fused[start:end] = powers * (state + np.cumsum(u[start:end] / powers, axis = 0))
+                    state = fused[end - 1]
+
+        linear_acc = None
+        if acc is not None and fused is not None:
+            pitch, roll = np.radians(fused[:, 0]), np.radians(fused[:, 1])
+            gravity = np.stack((-np.sin(pitch),
+                                np.sin(roll) * np.cos(pitch),
+                                np.cos(roll) * np.cos(pitch)), axis = 1)
+            linear_acc = np.asarray(acc, dtype = float) - gravity
+
+        if fused is not None:
+            self.angles = fused[-1].copy()
+        self.last_time = t[-1]
+        self.samples_processed += n
+        return {"t": t, "angles": fused, "linear_acc": linear_acc}
+
+    def chunkLength(self):
+        '''
+        Number of samples solved at once: at most chunk_size, and few enough that alpha**-n stays well within
+        the range of float64 (about 1e308), i.e. n * log(1 / alpha) below 600
+        '''
+        if self.alpha >= 1:
+            return self.chunk_size
+        return max(1, min(self.chunk_size, int(600 / np.log(1 / self.alpha))))
+
+    def _channels(self, samples, names):
+        '''
+        Gather one (N, 3) array from a list of sample dictionaries, or None if the channels aren't streamed
+        '''
+        if not all(name in samples[0] for name in names):
+            return None
+        return np.array([[s[name] for name in names] for s in samples])
+
+def benchmark(n_samples = 100000, batch_size = 256, rate = 100.0):
+    '''
+    Measure the number of samples per second the filter can process, using a synthetic sensor stream, and
+    compare against a plain Python loop doing the same computation per sample. Returns the two rates.
+    '''
+    rng = np.random.default_rng(0)
+    t = np.arange(n_samples) / rate
+    true_angles = np.stack((10 * np.sin(t), 5 * np.cos(t), (30 * t) % 360 - 180), axis = 1)
+    angles = true_angles + rng.normal(0, 2, true_angles.shape)
+    angles[:, 2] = (angles[:, 2] + 180) % 360 - 180
+    gyro = np.gradient(np.unwrap(true_angles, period = 360.0, axis = 0), t, axis = 0) + rng.normal(0, 0.5, angles.shape)
+    acc = rng.normal(0, 0.05, angles.shape) + [0, 0, 1]
+
+    fusion = ImuFusion(batch_size = batch_size)
+    start = time.perf_counter()
+    for i in range(0, n_samples, batch_size):
+        fusion.update(t[i:i + batch_size], angles[i:i + batch_size], gyro[i:i + batch_size], acc[i:i + batch_size])
+    vectorized = n_samples / (time.perf_counter() - start)
+
+    # Same filter, one sample at a time in Python, as applications did before:
+    a = fusion.alpha
+    state = list(angles[0])
+    previous = t[0]
+    start = time.perf_counter()
+    for k in range(n_samples):
+        dt = t[k] - previous
+        previous = t[k]
+        for axis in range(3):
+            measured = angles[k][axis] + 360.0 * round((state[axis] - angles[k][axis]) / 360.0)
+            state[axis] = a * (state[axis] + gyro[k][axis] * dt) + (1 - a) * measured
+    python_loop = n_samples / (time.perf_counter() - start)
+
+    return vectorized, python_loop
+
+if __name__ == "__main__":
+    for batch_size in (16, 256, 4096):
+        vectorized, python_loop = benchmark(batch_size = batch_size)
+        print("Batch size {:5d}: {:12,.0f} samples/s (per-sample Python loop: {:,.0f} samples/s)".format(
+            batch_size, vectorized, python_loop))
@@ -1,17 +1,21 @@
 from bluepy.btle import Peripheral
 from bluepy import btle
 from sphero_constants import *
+from collections import deque
 import struct
 import time
 import sys
 
 class sphero_mini():
-    def __init__(self, MACAddr, verbosity = 4, user_delegate = None):
+    def __init__(self, MACAddr, verbosity = 4, user_delegate = None, retries = 2):
         '''
         initialize class instance and then build collect BLE sevices and characteristics.
         Also sends text string to Anti-DOS characteristic to prevent returning to sleep,
         and initializes notifications (which is what the sphero uses to send data back to
         the client).
+
+        retries: number of times an unacknowledged roll, LED or stabilization command is sent again
+        (these commands are safe to repeat). Other commands are sent once.
         '''
         self.verbosity = verbosity # 0 = Silent,
                                    # 1 = Connection/disconnection only
@@ -19,8 +23,15 @@ class sphero_mini():
                                    # 3 = Recieved commands
                                    # 4 = Acknowledgements
         self.sequence = 1
+        self.retries = retries
         self.v_batt = None # will be updated with battery voltage when sphero.getBatteryVoltage() is called
         self.firmware_version = [] # will be updated with firware version when sphero.returnMainApplicationVersion() is called
+        self.configured_sensors = [] # will be updated with the list of streamed sensors when sphero.configureSensorMask() is called
+        self.sensor_listeners = [] # functions called with every decoded sensor sample (see addSensorListener())
+        self.last_sample = None # most recent decoded sensor sample (see handleNotification() in the MyDelegate class)
+        self.last_collision_time = None # host receive time (time.monotonic()) of the last collision notification
+        self.link = LinkStats() # command round-trip times, missing/late responses and lost sensor frames
+        self.clock = ClockSync() # offset and drift between the sphero's timer and the host clock
 
         if self.verbosity > 0:
             print("[INFO] Connecting to", MACAddr)
@@ -113,12 +124,10 @@ class sphero_mini():
         if self.verbosity > 2:
             print("[SEND {}] Setting main LED colour to [{}, {}, {}]".format(self.sequence, red, green, blue))
         
-        self._send(characteristic = self.API_V2_characteristic,
-                  devID = deviceID['userIO'], # 0x1a
-                  commID = userIOCommandIDs["allLEDs"], # 0x0e
-                  payload = [0x00, 0x0e, red, green, blue])
-
-        self.getAcknowledgement("LED/backlight")
+        self._sendWithRetries("LED/backlight",
+                              devID = deviceID['userIO'], # 0x1a
+                              commID = userIOCommandIDs["allLEDs"], # 0x0e
+                              payload = [0x00, 0x0e, red, green, blue])
 
     def setBackLEDIntensity(self, brightness=None):
         '''
@@ -129,12 +138,10 @@ class sphero_mini():
         if self.verbosity > 2:
             print("[SEND {}] Setting backlight intensity to {}".format(self.sequence, brightness))
 
-        self._send(characteristic = self.API_V2_characteristic,
-                  devID = deviceID['userIO'],
-                  commID = userIOCommandIDs["allLEDs"],
-                  payload = [0x00, 0x01, brightness])
-
-        self.getAcknowledgement("LED/backlight")
+        self._sendWithRetries("LED/backlight",
+                              devID = deviceID['userIO'],
+                              commID = userIOCommandIDs["allLEDs"],
+                              payload = [0x00, 0x01, brightness])
 
     def roll(self, speed=None, heading=None):
         '''
@@ -158,12 +165,10 @@ class sphero_mini():
         speedL = speed & 0xFF
         headingH = (heading & 0xFF00) >> 8
         headingL = heading & 0xFF
-        self._send(characteristic = self.API_V2_characteristic,
-                  devID = deviceID['driving'],
-                  commID = drivingCommands["driveWithHeading"],
-                  payload = [speedL, headingH, headingL, speedH])
-
-        self.getAcknowledgement("Roll")
+        self._sendWithRetries("Roll",
+                              devID = deviceID['driving'],
+                              commID = drivingCommands["driveWithHeading"],
+                              payload = [speedL, headingH, headingL, speedH])
 
     def resetHeading(self):
         '''
@@ -181,9 +186,10 @@ class sphero_mini():
 
         self.getAcknowledgement("Heading")
 
-    def returnMainApplicationVersion(self):
+    def returnMainApplicationVersion(self, timeout = None):
         '''
-        Sends command to return application data in a notification
+        Sends command to return application data in a notification.
+        timeout: seconds to wait for the response (see getAcknowledgement())
         '''
         if self.verbosity > 2:
             print("[SEND {}] Requesting firmware version".format(self.sequence))
@@ -193,12 +199,13 @@ class sphero_mini():
                    commID = SystemInfoCommands['mainApplicationVersion'],
                    payload = []) # empty
 
-        self.getAcknowledgement("Firmware")
+        self.getAcknowledgement("Firmware", timeout)
 
-    def getBatteryVoltage(self):
+    def getBatteryVoltage(self, timeout = None):
         '''
         Sends command to return battery voltage data in a notification.
         Data printed to console screen by the handleNotifications() method in the MyDelegate class.
+        timeout: seconds to wait for the response (see getAcknowledgement())
         '''
         if self.verbosity > 2:
             print("[SEND {}] Requesting battery voltage".format(self.sequence))
@@ -208,7 +215,7 @@ class sphero_mini():
                    commID=powerCommandIDs['batteryVoltage'],
                    payload=[]) # empty
 
-        self.getAcknowledgement("Battery")
+        self.getAcknowledgement("Battery", timeout)
 
     def stabilization(self, stab = True):
         '''
@@ -222,12 +229,10 @@ class sphero_mini():
             if self.verbosity > 2:
                     print("[SEND {}] Disabling stabilization".format(self.sequence))
             val = 0
-        self._send(self.API_V2_characteristic,
-                   devID=deviceID['driving'],
-                   commID=drivingCommands['stabilization'],
-                   payload=[val])
-
-        self.getAcknowledgement("Stabilization")
+        self._sendWithRetries("Stabilization",
+                              devID=deviceID['driving'],
+                              commID=drivingCommands['stabilization'],
+                              payload=[val])
 
     def wait(self, delay):
         '''
@@ -259,15 +264,12 @@ class sphero_mini():
         - End byte: always 0xD8
 
         '''
+        seq = self._nextSequence()
         sendBytes = [sendPacketConstants["StartOfPacket"],
                     sum([flags["resetsInactivityTimeout"], flags["requestsResponse"]]),
                     devID,
                     commID,
-                    self.sequence] + payload # concatenate payload list
-
-        self.sequence += 1 # Increment sequence number, ensures we can identify response packets are for this command
-        if self.sequence > 255:
-            self.sequence = 0
+                    seq] + payload # concatenate payload list
 
         # Compute and append checksum and add EOP byte:
         # From Sphero docs: "The [checksum is the] modulo 256 sum of all the bytes
@@ -284,26 +286,105 @@ class sphero_mini():
         output = b"".join([x.to_bytes(1, byteorder='big') for x in sendBytes])
 
         #send to specified characteristic:
-        characteristic.write(output, withResponse = True)
+        self._sendPacket(characteristic, output, seq)
+
+    def _nextSequence(self):
+        '''
+        Return the sequence number for the next command, and advance it. For internal use only.
+        '''
+        seq = self.sequence
+        self.sequence += 1 # Increment sequence number, ensures we can identify response packets are for this command
+        if self.sequence > 255:
+            self.sequence = 0
+        return seq
 
-    def getAcknowledgement(self, ack):
-        #wait up to 10 secs for correct acknowledgement to come in, including sequence number!
+    def _sendPacket(self, characteristic, packet, seq):
+        '''
+        Write an already encoded packet (e.g. built in bulk for several spheros, see sphero_swarm.py), whose
+        sequence number was obtained from _nextSequence(). For internal use only.
+        '''
+        characteristic.write(packet, withResponse = True)
+        self.link.commandSent(seq, time.monotonic()) # time the round trip from here to the response
+
+    def _sendWithRetries(self, ack, devID=None, commID=None, payload=[]):
+        '''
+        Send a command that is safe to repeat, and send it again (with a new sequence number) if it isn't
+        acknowledged in time, up to self.retries times. Returns True if the command was acknowledged.
+        For internal use only.
+        '''
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.link.retransmissions += 1
+                if self.verbosity > 2:
+                    print("[RESEND {}] {} (attempt {}/{})".format(self.sequence, ack, attempt + 1, self.retries + 1))
+            self._send(self.API_V2_characteristic, devID=devID, commID=commID, payload=payload)
+            if self.getAcknowledgement(ack, timeout = self.link.rto): # re-send after the adaptive timeout
+                return True
+        self.link.failed_commands += 1
+        print("Giving up on command: {}".format(ack), file=sys.stderr)
+        return False
+
+    def getAcknowledgement(self, ack, timeout = None):
+        '''
+        Wait for the acknowledgement of the last command sent, including sequence number. Returns True if it
+        arrived, or False after timeout seconds. The default timeout (link.max_rto, 10 seconds) suits commands
+        that are sent only once. Commands that are re-sent when unacknowledged (see _sendWithRetries()) wait for
+        link.rto instead, which adapts to the measured round-trip times of this connection.
+        '''
+        expected = (self.sequence - 1) & 0xFF # one less than sequence, because _send function increments it for next send (wrapping 0 -> 255)
+        if timeout is None:
+            timeout = self.link.max_rto
         start = time.time()
         while(1):
-            self.p.waitForNotifications(1)
-            if self.sphero_delegate.notification_seq == self.sequence-1: # use one less than sequence, because _send function increments it for next send. 
+            self.p.waitForNotifications(max(start + timeout - time.time(), 0.001)) # returns early when a notification arrives
+            if self.sphero_delegate.notification_seq == expected:
+                rtt = self.link.responseReceived(expected, self.sphero_delegate.notification_time)
                 if self.verbosity > 3:
-                    print("[RESP {}] {}".format(self.sequence-1, self.sphero_delegate.notification_ack))
+                    print("[RESP {}] {} (RTT {:.1f}ms)".format(expected, self.sphero_delegate.notification_ack, rtt*1000))
                 self.sphero_delegate.clear_notification()
-                break
+                return True
             elif self.sphero_delegate.notification_seq >= 0:
+                # Response to some other command: late (its own wait already timed out) or not ours at all
+                self.link.responseReceived(self.sphero_delegate.notification_seq, self.sphero_delegate.notification_time)
                 print("Unexpected ACK. Expected: {}/{}, received: {}/{}".format(
-                    ack, self.sequence, self.sphero_delegate.notification_ack.split()[0],
+                    ack, expected, self.sphero_delegate.notification_ack.split()[0],
                     self.sphero_delegate.notification_seq),
                     file=sys.stderr)
-            if time.time() > start + 10:
-                print("Timeout waiting for acknowledgement: {}/{}".format(ack, self.sequence), file=sys.stderr)
-                break
+                self.sphero_delegate.clear_notification()
+            if time.time() > start + timeout:
+                self.link.responseMissed(expected)
+                print("Timeout waiting for acknowledgement after {:.2f}s: {}/{}".format(timeout, ack, expected),
+                      file=sys.stderr)
+                return False
+
+    def addSensorListener(self, callback):
+        '''
+        Register a function to be called with every decoded sensor sample. The sample is a dictionary
+        containing one value per configured sensor (e.g. sample['IMU_yaw']), plus:
+
+        - 'timestamp': host receive time of the sample, from time.monotonic() (seconds)
+        - 'device_time': the sphero's own timer value in seconds (only if timer = True in configureSensorMask())
+        - 'latency': estimated transport latency of the sample in seconds (only with the device timer, see ClockSync)
+
+        Listeners are called from within the notification handler, so they should return quickly.
+        '''
+        self.sensor_listeners.append(callback)
+
+    def removeSensorListener(self, callback):
+        '''
+        Stop calling a function previously registered with addSensorListener()
+        '''
+        if callback in self.sensor_listeners:
+            self.sensor_listeners.remove(callback)
+
+    def publishSharedMemory(self, name = None, capacity = 4096):
+        '''
+        Publish every decoded sensor sample into a shared memory ring buffer, which other processes can read
+        with sphero_shm.SensorRing.attach(name). Call after configureSensorMask(). Returns the SensorRing;
+        call its close() method to stop publishing and free the shared memory.
+        '''
+        import sphero_shm # only needed by programs sharing sensor data between processes
+        return sphero_shm.SensorRing.publish(self, name, capacity)
 
 # =======================================================================
 # The following functions are experimental:
@@ -379,7 +460,8 @@ class sphero_mini():
                             IMU_acc_z = False,
                             IMU_gyro_x = False,
                             IMU_gyro_y = False,
-                            IMU_gyro_z = False):
+                            IMU_gyro_z = False,
+                            timer = False):
 
         '''
         Send command to configure sensor mask using default values as found during bluetooth 
@@ -392,6 +474,10 @@ class sphero_mini():
         
         All IMU bool parameters: Toggle transmission of that value on or off (e.g. set IMU_acc_x = True to include the 
                 X-axis accelerometer readings in the sensor stream)
+
+        timer: Include the sphero's internal timer (assumed to be milliseconds, sent as an unsigned 32-bit integer) in the
+                stream. This allows the offset and drift between the sphero's clock and the host to be estimated (see
+                ClockSync), and lost or out-of-order sensor frames to be detected (see LinkStats). Still experimental.
         '''
 
         # Construct bitfields based on function parameters:
@@ -411,7 +497,7 @@ class sphero_mini():
                             0b00,               # Unknown param: seems to be another accelerometer bitfield? Z-acc, Y-acc
                             IMU_bitfield1,
                             IMU_bitfield2,
-                            0b00])              # reserved, Position?, Position?, velocity?, velocity?, Y-gyro, timer, reserved
+                            timer<<1])          # reserved, Position?, Position?, velocity?, velocity?, Y-gyro, timer, reserved
 
         self.getAcknowledgement("Mask")
 
@@ -431,11 +517,16 @@ class sphero_mini():
                             "IMU_acc_x" : IMU_acc_x,
                             "IMU_gyro_y" : IMU_gyro_y,
                             "IMU_gyro_x" : IMU_gyro_x,
-                            "IMU_gyro_z" : IMU_gyro_z}
+                            "IMU_gyro_z" : IMU_gyro_z,
+                            "timer" : timer}
         
         # Create list of of only sensors that have been "activated" (set as true in the method arguments):
         self.configured_sensors = [name for name in availableSensors if availableSensors[name] == True]
 
+        # The stream restarts with the new configuration, so previous timing history no longer applies:
+        self.link.resetSensorFrames()
+        self.clock.reset()
+
     def sensor1(self): # Use default values
         '''
         Unknown function. Observed in bluetooth sniffing. 
@@ -460,6 +551,206 @@ class sphero_mini():
 
 # =======================================================================
 
+class LinkStats():
+
+    '''
+    Bookkeeping for the bluetooth link: round-trip times of commands, responses that arrive late, unexpectedly
+    or not at all, and sensor frames that were lost, corrupted or arrived out of order.
+
+    Lost and out-of-order sensor frames can only be detected when the sphero's timer is included in the sensor
+    stream (see configureSensorMask()), since the sensor packets carry no sequence number of their own.
+
+    The retransmission timeout (rto) adapts to the connection like TCP's (RFC 6298): the smoothed round-trip
+    time plus four times its variation, doubled after every timeout, and kept between min_rto and max_rto. It
+    only decides when a command that is safe to repeat is sent again; commands sent once wait up to max_rto.
+    Every retransmission gets a new sequence number, so each round trip is measured without ambiguity about
+    which transmission a response belongs to.
+
+    The min_rto floor of 0.3 seconds spans several bluetooth connection intervals, so that an acknowledgement
+    delayed by a few missed connection events isn't mistaken for a lost one.
+    '''
+
+    def __init__(self, window = 100, initial_rto = 1.0, min_rto = 0.3, max_rto = 10.0):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = initial_rto # current retransmission timeout (seconds)
+        self.srtt = None # smoothed round-trip time (seconds)
+        self.rttvar = None # round-trip time variation (seconds)
+        self.pending = {} # sequence number -> host send time, for commands waiting on a response
+        self.expired = {} # sequence number -> host send time, for commands whose wait has timed out
+        self.rtt_samples = deque(maxlen = window) # most recent round-trip times (seconds)
+        self.rtt = None # last measured round-trip time (seconds)
+        self.rtt_min = None # fastest round-trip time seen (seconds)
+        self.responses = 0 # responses matched to a command
+        self.late_responses = 0 # responses that arrived after their command had timed out
+        self.unexpected_responses = 0 # responses that match no command sent on this connection
+        self.missed_responses = 0 # commands whose response never arrived in time
+        self.retransmissions = 0 # commands sent again after a missed response
+        self.failed_commands = 0 # commands still unacknowledged after all retries
+        self.corrupt_packets = 0 # notification packets discarded as unparseable or failing the checksum
+        self.resetSensorFrames()
+
+    def resetSensorFrames(self):
+        self.sensor_frames = 0 # sensor frames received
+        self.dropped_sensor_frames = 0 # frames missing from the stream (inferred from gaps in the device timer)
+        self.reordered_sensor_frames = 0 # frames whose device timer went backwards
+        self.sensor_period = None # estimated interval between sensor frames, in seconds of device time
+        self.last_device_time = None
+        self.gaps = deque(maxlen = 16) # recent gaps, as [start, end, frames still missing] in device time
+
+    def commandSent(self, seq, send_time):
+        self.pending[seq] = send_time
+        self.expired.pop(seq, None) # sequence numbers wrap around after 256 commands
+
+    def responseReceived(self, seq, receive_time):
+        '''
+        Match a response to the command with the same sequence number. Returns the round-trip time in seconds,
+        or None if the response was late or unexpected.
+        '''
+        if seq in self.pending:
+            rtt = receive_time - self.pending.pop(seq)
+            self.responses += 1
+            self.rtt = rtt
+            self.rtt_samples.append(rtt)
+            if self.rtt_min is None or rtt < self.rtt_min:
+                self.rtt_min = rtt
+            if self.srtt is None:
+                self.srtt, self.rttvar = rtt, rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+            self.rto = min(max(self.srtt + 4 * self.rttvar, self.min_rto), self.max_rto)
+            return rtt
+        elif seq in self.expired:
+            del self.expired[seq]
+            self.late_responses += 1
+        else:
+            self.unexpected_responses += 1
+        return None
+
+    def responseMissed(self, seq):
+        if seq in self.pending:
+            self.expired[seq] = self.pending.pop(seq)
+        self.missed_responses += 1
+        self.rto = min(self.rto * 2, self.max_rto) # back off: the link may be slower than measured so far
+
+    def sensorFrame(self, device_time):
+        '''
+        Check a sensor frame's device timer (seconds) against the previous frame to detect gaps and reordering.
+        '''
+        self.sensor_frames += 1
+        if self.last_device_time is None:
+            self.last_device_time = device_time
+            return
+
+        delta = device_time - self.last_device_time
+        if delta <= 0:
+            self.reordered_sensor_frames += 1
+            for gap in self.gaps:
+                if gap[0] < device_time < gap[1] and gap[2] > 0:
+                    # The frame was counted as dropped when the gap was seen, but it was only late
+                    gap[2] -= 1
+                    self.dropped_sensor_frames -= 1
+                    break
+            return # keep comparing against the newest frame seen
+        self.last_device_time = device_time
+
+        if self.sensor_period is None or delta < 0.75 * self.sensor_period:
+            self.sensor_period = delta # first estimate, or the previous estimate was itself spanning a gap
+        elif delta > 1.5 * self.sensor_period:
+            missing = round(delta / self.sensor_period) - 1
+            self.dropped_sensor_frames += missing
+            self.gaps.append([device_time - delta, device_time, missing])
+        else:
+            self.sensor_period += 0.05 * (delta - self.sensor_period) # track slow changes (e.g. clock drift)
+
+    def stats(self):
+        '''
+        Return the counters and timing estimates as a dictionary (times in seconds)
+        '''
+        return {"responses": self.responses,
+                "late_responses": self.late_responses,
+                "unexpected_responses": self.unexpected_responses,
+                "missed_responses": self.missed_responses,
+                "retransmissions": self.retransmissions,
+                "failed_commands": self.failed_commands,
+                "corrupt_packets": self.corrupt_packets,
+                "sensor_frames": self.sensor_frames,
+                "dropped_sensor_frames": self.dropped_sensor_frames,
+                "reordered_sensor_frames": self.reordered_sensor_frames,
+                "rtt": self.rtt,
+                "rtt_min": self.rtt_min,
+                "srtt": self.srtt,
+                "rttvar": self.rttvar,
+                "rto": self.rto}
+
+    def oneWayLatency(self):
+        '''
+        Best-case one-way transport latency, estimated as half of the fastest round trip seen (seconds)
+        '''
+        if self.rtt_min is None:
+            return 0.0
+        return self.rtt_min / 2
+
+class ClockSync():
+
+    '''
+    Estimates the relationship between the sphero's internal timer and the host clock (time.monotonic()) from
+    the (device_time, receive_time) pairs of streamed sensor samples:
+
+        receive_time = offset + (1 + drift) * device_time + delay
+
+    Since the transport delay is never negative, the fastest samples lie on the line itself. The slope is found
+    between the fastest sample of the older and newer halves of a sliding window, and the offset is then taken
+    from the fastest sample overall (the lower envelope), which makes the fit insensitive to latency jitter.
+    Drift is only estimated once the window spans at least min_span seconds of device time, and is limited to
+    +/- max_drift, since real clock crystals differ by tens of ppm at most.
+    '''
+
+    def __init__(self, window = 300, min_span = 10.0, max_drift = 0.001):
+        self.samples = deque(maxlen = window)
+        self.min_span = min_span
+        self.max_drift = max_drift
+        self.reset()
+
+    def reset(self):
+        self.samples.clear()
+        self.offset = None # host time corresponding to device time zero, at minimum delay (seconds)
+        self.drift = 0.0 # fractional rate difference between the two clocks (multiply by 1e6 for ppm)
+
+    def update(self, device_time, host_time):
+        self.samples.append((device_time, host_time))
+        samples = list(self.samples)
+        half = len(samples) // 2
+        if half >= 2 and samples[-1][0] - samples[0][0] >= self.min_span:
+            d1, h1 = min(samples[:half], key = lambda s: s[1] - s[0])
+            d2, h2 = min(samples[half:], key = lambda s: s[1] - s[0])
+            if d2 > d1:
+                drift = (h2 - h1) / (d2 - d1) - 1
+                self.drift = max(-self.max_drift, min(self.max_drift, drift))
+        rate = 1 + self.drift
+        self.offset = min(h - rate * d for d, h in samples)
+
+    def toHostTime(self, device_time):
+        '''
+        Convert a device timer value to the host time.monotonic() at which it would arrive with minimum delay
+        '''
+        if self.offset is None:
+            return None
+        return self.offset + (1 + self.drift) * device_time
+
+    def latency(self, device_time, host_time, base_latency = 0.0):
+        '''
+        Estimated transport latency of a sample: the delay above the fastest sample seen, plus base_latency
+        (the minimum one-way latency, e.g. from LinkStats.oneWayLatency(), since this cannot be observed from a
+        one-way stream).
+        '''
+        if self.offset is None:
+            return None
+        return max(host_time - self.toHostTime(device_time), 0.0) + base_latency
+
+# =======================================================================
+
 class MyDelegate(btle.DefaultDelegate):
 
     '''
@@ -479,6 +770,7 @@ class MyDelegate(btle.DefaultDelegate):
     def clear_notification(self):
         self.notification_ack = "DEFAULT ACK"
         self.notification_seq = -1
+        self.notification_time = None # host receive time (time.monotonic()) of the response
 
     def bits_to_num(self, bits):
         '''
@@ -500,6 +792,8 @@ class MyDelegate(btle.DefaultDelegate):
         encountered. Note that this is an issue, because 0xD8 could be sent as part of the payload of,
         say, the battery voltage notification. In future, a more sophisticated method will be required.
         '''
+        receive_time = time.monotonic() # stamp as early as possible, before any parsing
+
         # Allow the user to intercept and process data first..
         if self.user_delegate != None:
             if self.user_delegate.handleNotification(cHandle, data):
@@ -519,6 +813,7 @@ class MyDelegate(btle.DefaultDelegate):
                     start, flags_bits, devid, commcode, seq, *notification_payload, chsum, end = self.notificationPacket
                 except ValueError:
                     print("Warning: notification packet unparseable", self.notificationPacket, file=sys.stderr)
+                    self.sphero_class.link.corrupt_packets += 1
                     self.notificationPacket = [] # Discard this packet
                     return # exit
 
@@ -534,6 +829,7 @@ class MyDelegate(btle.DefaultDelegate):
                 checksum = 0xff - checksum # bitwise 'not' to invert checksum bits
                 if checksum != chsum: # check computed checksum against that recieved in the packet
                     print("Warning: notification packet checksum failed", self.notificationPacket, file=sys.stderr)
+                    self.sphero_class.link.corrupt_packets += 1
                     self.notificationPacket = [] # Discard this packet
                     return # exit
 
@@ -587,6 +883,7 @@ class MyDelegate(btle.DefaultDelegate):
                         print(self.notificationPacket, "===================> Unknown ack packet")
 
                     self.notification_seq = seq
+                    self.notification_time = receive_time
 
                 else: # Not a response packet - therefore, asynchronous notification (e.g. collision detection, etc):
                     
@@ -603,6 +900,7 @@ class MyDelegate(btle.DefaultDelegate):
                         print("\tX_mag:", X_mag)
                         print("\tY_mag:", Y_mag)
 
+                        self.sphero_class.last_collision_time = receive_time
                         if self.sphero_class.collision_detection_callback is not None:
                             self.notificationPacket = [] # need to clear packet, in case new notification comes in during callback
                             self.sphero_class.collision_detection_callback()
@@ -620,12 +918,31 @@ class MyDelegate(btle.DefaultDelegate):
                             num, val = val[:32], val[32:] # Slice off first 16 bits
                             nums.append(num)
                         
-                        # convert from raw bits to float:
-                        nums = [self.bits_to_num(num) for num in nums]
+                        # convert from raw bits to float (the timer is an unsigned integer, in milliseconds):
+                        sample = {}
+                        for name, num in zip(self.sphero_class.configured_sensors, nums):
+                            if name == "timer":
+                                sample["device_time"] = int(num, 2) / 1000
+                            else:
+                                sample[name] = self.bits_to_num(num)
+                        sample["timestamp"] = receive_time
+
+                        if "device_time" in sample:
+                            self.sphero_class.link.sensorFrame(sample["device_time"])
+                            self.sphero_class.clock.update(sample["device_time"], receive_time)
+                            sample["latency"] = self.sphero_class.clock.latency(sample["device_time"], receive_time,
+                                                                                self.sphero_class.link.oneWayLatency())
+                        else:
+                            self.sphero_class.link.sensor_frames += 1
 
                         # Set sensor values as class attributes:
-                        for name, value in zip(self.sphero_class.configured_sensors, nums):
-                            setattr(self.sphero_class, name, value)
+                        for name, value in sample.items():
+                            if name in self.sphero_class.configured_sensors:
+                                setattr(self.sphero_class, name, value)
+                        self.sphero_class.last_sample = sample
+
+                        for listener in self.sphero_class.sensor_listeners:
+                            listener(sample)
                         
                     # Unrecognized packet structure:
                     else:
@@ -0,0 +1,203 @@
+'''
+Priority scheduling of commands for the sphero_mini class.
+
+The sphero only handles one command at a time: each send blocks until its acknowledgement arrives. When
+telemetry requests (battery voltage, firmware version) are issued from the same thread as driving commands,
+a slow telemetry response delays the next roll. The CommandScheduler owns the connection from a background
+thread and always sends the highest priority command waiting, so that driving never queues behind telemetry.
+It also refreshes sphero.v_batt and sphero.firmware_version by itself whenever the link has been idle for a
+while.
+
+Usage:
+
+    scheduler = CommandScheduler(sphero)
+    scheduler.start()
+    scheduler.roll(100, 0) # returns immediately
+    scheduler.submit("led", sphero.setLEDColor, red = 255, green = 0, blue = 0)
+    print(scheduler.queueDepths())
+    scheduler.stop()
+
+NOTE: once started, the scheduler's thread is the only one that may talk to the sphero. Send every command
+through submit() (or the convenience methods), and use scheduler.wait() instead of sphero.wait().
+'''
+
+from concurrent.futures import Future
+import itertools
+import threading
+import queue
+import time
+import sys
+
+# Lower number = higher priority. A command is never interrupted once sent, but any queued drive
+# command is sent before any queued LED or telemetry command.
+commandLanes = {"drive": 0,         # driving and safety: roll, stabilization, heading, sleep
+                "led": 1,           # main LED and back LED
+                "telemetry": 2}     # battery voltage, firmware version, sensor configuration
+
+class CommandScheduler():
+    def __init__(self, sphero, telemetry_interval = 30, idle_time = 0.5, poll_interval = 0.01):
+        '''
+        sphero: a connected sphero_mini instance
+        telemetry_interval: seconds between automatic battery voltage refreshes (None to disable)
+        idle_time: the link must have been idle for this many seconds before telemetry is polled
+        poll_interval: seconds to wait for notifications between checks of the queue. This bounds the delay
+                before a newly submitted command is sent while the link is idle.
+        '''
+        self.sphero = sphero
+        self.telemetry_interval = telemetry_interval
+        self.idle_time = idle_time
+        self.poll_interval = poll_interval
+
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count() # keeps commands of equal priority first-in, first-out
+        self.lock = threading.Lock()   # protects the metrics and the drive coalescing token
+        self.lane_metrics = {lane: {"depth": 0,         # commands currently waiting
+                                    "max_depth": 0,     # largest number of commands waiting at once
+                                    "sent": 0,          # commands sent to the sphero
+                                    "superseded": 0,    # drive commands skipped because a newer one was queued
+                                    "wait_time": 0.0}   # total seconds commands spent queued before sending
+                             for lane in commandLanes}
+        self.latest_drive = None
+        self.last_activity = time.monotonic()
+        self.last_telemetry = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        '''
+        Start the scheduler thread
+        '''
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+    def stop(self, timeout = None):
+        '''
+        Stop the scheduler thread after the command currently being sent (queued commands are cancelled)
+        '''
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        while True:
+            try:
+                _, _, lane, future, *_ = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._dequeued(lane)
+            future.cancel()
+
+    def submit(self, lane, method, *args, **kwargs):
+        '''
+        Queue a call to one of the sphero's methods (e.g. sphero.setLEDColor) in the given lane (see
+        commandLanes). Returns a concurrent.futures.Future, which completes once the command has been sent
+        and acknowledged.
+        '''
+        return self._put(lane, method, args, kwargs, coalesce = False)
+
+    def roll(self, speed, heading):
+        '''
+        Queue a roll command. Only the newest waiting roll is sent: a roll that is superseded before it
+        reaches the sphero completes with a result of None without being sent.
+        '''
+        return self._put("drive", self.sphero.roll, (speed, heading), {}, coalesce = True)
+
+    def stopRolling(self):
+        return self.roll(0, 0)
+
+    def queueDepths(self):
+        '''
+        Return the number of commands waiting in each lane
+        '''
+        with self.lock:
+            return {lane: metrics["depth"] for lane, metrics in self.lane_metrics.items()}
+
+    def metrics(self):
+        '''
+        Return a copy of the per-lane metrics (see __init__ for their meaning)
+        '''
+        with self.lock:
+            return {lane: dict(metrics) for lane, metrics in self.lane_metrics.items()}
+
+    def wait(self, delay):
+        '''
+        Sleep for delay seconds. Use this instead of sphero.wait() while the scheduler is running (the
+        scheduler thread keeps handling notifications in the meantime).
+        '''
+        time.sleep(delay)
+
+    def _put(self, lane, method, args, kwargs, coalesce):
+        if lane not in commandLanes:
+            raise ValueError("Unknown command lane '{}', expected one of {}".format(lane, list(commandLanes)))
+        future = Future()
+        order = next(self.order)
+        with self.lock:
+            metrics = self.lane_metrics[lane]
+            metrics["depth"] += 1
+            metrics["max_depth"] = max(metrics["max_depth"], metrics["depth"])
+            if coalesce:
+                self.latest_drive = order
+        self.queue.put((commandLanes[lane], order, lane, future, method, args, kwargs, coalesce, time.monotonic()))
+        return future
+
+    def _dequeued(self, lane):
+        with self.lock:
+            self.lane_metrics[lane]["depth"] -= 1
+
+    def _run(self):
+        while self.running:
+            try:
+                _, order, lane, future, method, args, kwargs, coalesce, queued_at = self.queue.get_nowait()
+            except queue.Empty:
+                self.sphero.p.waitForNotifications(self.poll_interval) # keep sensor notifications flowing
+                self._pollTelemetry()
+                continue
+
+            self._dequeued(lane)
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self.lock:
+                superseded = coalesce and order != self.latest_drive
+                if superseded:
+                    self.lane_metrics[lane]["superseded"] += 1
+                else:
+                    self.lane_metrics[lane]["sent"] += 1
+                    self.lane_metrics[lane]["wait_time"] += time.monotonic() - queued_at
+            if superseded:
+                future.set_result(None)
+                continue
+
+            try:
+                future.set_result(method(*args, **kwargs))
+            except Exception as e:
+                print("Scheduled command failed:", e, file=sys.stderr)
+                future.set_exception(e)
+            self.last_activity = time.monotonic()
+
+    def _pollTelemetry(self):
+        '''
+        Refresh battery voltage (and firmware version, until it is known) every telemetry_interval seconds,
+        but only once the link has been idle for idle_time seconds
+        '''
+        if self.telemetry_interval is None:
+            return
+        now = time.monotonic()
+        if now - self.last_activity < self.idle_time or self.queueDepths()["telemetry"] > 0:
+            return
+        if self.last_telemetry is None or now - self.last_telemetry > self.telemetry_interval:
+            self.last_telemetry = now
+            if not self.sphero.firmware_version:
+                self.submit("telemetry", self._pollFirmwareVersion)
+            self.submit("telemetry", self._pollBatteryVoltage)
+
+    # Automatic polls wait only for the link's retransmission timeout, not the 10 s allowed to other commands,
+    # since commands queued meanwhile can't be sent until they finish. A lost response is simply requested
+    # again after the next telemetry_interval.
+
+    def _pollFirmwareVersion(self):
+        self.sphero.returnMainApplicationVersion(timeout = self.sphero.link.rto)
+
+    def _pollBatteryVoltage(self):
+        self.sphero.getBatteryVoltage(timeout = self.sphero.link.rto)
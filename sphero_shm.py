@@ -0,0 +1,224 @@
+'''
+Shared memory ring buffer of sensor samples, for consumers running in other processes.
+
+Sensor values normally live as attributes of the sphero_mini instance, in the process that owns the bluetooth
+connection. A SensorRing publishes every decoded sample into a multiprocessing.shared_memory block instead, which
+any number of processes on the same machine can attach to by name and read without copying data between
+processes or serializing it:
+
+    # Process owning the connection:
+    ring = sphero.publishSharedMemory("sphero1") # after configureSensorMask()
+
+    # Any other process:
+    ring = SensorRing.attach("sphero1")
+    print(ring.latest()) # {'timestamp': ..., 'IMU_yaw': ...}
+    rows = ring.window(100) # last 100 samples as (timestamp, value, value, ...) tuples (copied)
+
+    # Or without copying, checking afterwards that the writer didn't overwrite the slots while they were read:
+    views, sequence = ring.windowViews(100)
+    data = numpy.concatenate(views)
+    if not ring.unchanged(sequence, len(data)):
+        ... # read again
+
+Layout of the block (native byte order):
+
+    offset 0    magic "SPHR", version (uint32), capacity (uint32), number of channels (uint32)
+    offset 16   sequence (uint64): incremented before and after each write, so it is odd while a sample is
+                being written, and twice the number of samples written otherwise (a "seqlock")
+    offset 24   channel names, 32 bytes each (UTF-8, zero padded)
+    then        capacity slots of float64: timestamp followed by one value per channel (NaN if missing)
+
+There must be only one writer. Readers never block the writer: they check the sequence before and after reading,
+and retry if a sample they read may have been overwritten meanwhile. Aligned 8-byte writes are assumed to be
+atomic, which holds on x86-64 and 64-bit ARM.
+'''
+
+from multiprocessing import shared_memory
+import struct
+import math
+
+magic = b"SPHR"
+layoutVersion = 1
+headerFormat = "4sIII"          # magic, version, capacity, number of channels
+sequenceOffset = 16
+namesOffset = 24
+nameLength = 32
+
+class SensorRing():
+    def __init__(self, shm, owner):
+        '''
+        Use SensorRing.create() or SensorRing.attach() rather than calling this directly
+        '''
+        self.shm = shm
+        self.owner = owner
+        found, version, self.capacity, n_channels = struct.unpack_from(headerFormat, shm.buf, 0)
+        if found != magic or version != layoutVersion:
+            raise ValueError("Shared memory block '{}' is not a sensor ring (version {})".format(shm.name, layoutVersion))
+        self.channels = [bytes(shm.buf[namesOffset + i * nameLength:namesOffset + (i + 1) * nameLength])
+                         .rstrip(b"\0").decode() for i in range(n_channels)]
+        self.width = 1 + n_channels # floats per slot
+        self.data_offset = namesOffset + n_channels * nameLength
+        self.data_offset += -self.data_offset % 8 # keep the float64s aligned
+        self.slot_format = "{}d".format(self.width)
+        self.slot_size = 8 * self.width
+        self.sphero = None
+
+    @classmethod
+    def create(cls, name, channels, capacity = 4096):
+        '''
+        Create a new ring (for the writer). name may be None to let the system choose one (see ring.name).
+        '''
+        for channel in channels:
+            if len(channel.encode()) > nameLength:
+                raise ValueError("Channel name '{}' is longer than {} bytes".format(channel, nameLength))
+        data_offset = namesOffset + len(channels) * nameLength
+        data_offset += -data_offset % 8
+        shm = shared_memory.SharedMemory(name, create = True, size = data_offset + capacity * 8 * (1 + len(channels)))
+        struct.pack_into(headerFormat, shm.buf, 0, magic, layoutVersion, capacity, len(channels))
+        struct.pack_into("Q", shm.buf, sequenceOffset, 0)
+        for i, channel in enumerate(channels):
+            struct.pack_into("{}s".format(nameLength), shm.buf, namesOffset + i * nameLength, channel.encode())
+        return cls(shm, owner = True)
+
+    @classmethod
+    def attach(cls, name):
+        '''
+        Attach to an existing ring by name (for readers)
+        '''
+        try:
+            shm = shared_memory.SharedMemory(name, track = False) # Python 3.13+
+        except TypeError:
+            # Older versions register the block for removal when this (reading) process exits: undo that.
+            # A reader sharing the writer's resource tracker (in the writer's process or a child of it) also
+            # undoes the writer's registration, so the block is then only removed by the writer's close().
+            from multiprocessing import resource_tracker
+            shm = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner = False)
+
+    @classmethod
+    def publish(cls, sphero, name = None, capacity = 4096):
+        '''
+        Create a ring for the sensors currently configured on a sphero_mini instance, and write every decoded
+        sample into it. Call configureSensorMask() first: the channels can't change once the ring is created.
+        '''
+        channels = [("device_time" if sensor == "timer" else sensor) for sensor in sphero.configured_sensors]
+        if "device_time" in channels:
+            channels.append("latency")
+        ring = cls.create(name, channels, capacity)
+        ring.sphero = sphero
+        sphero.addSensorListener(ring.write)
+        return ring
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def count(self):
+        '''
+        Number of samples written so far (the newest is in slot (count - 1) % capacity)
+        '''
+        return self._sequence() // 2
+
+    def write(self, sample):
+        '''
+        Write one decoded sample (see sphero_mini.addSensorListener()). Only the creating process may write.
+        '''
+        values = [sample["timestamp"]] + [sample.get(channel) for channel in self.channels]
+        self.writeValues([math.nan if value is None else value for value in values])
+
+    def writeValues(self, values):
+        '''
+        Write one slot: the timestamp followed by a value for each channel
+        '''
+        sequence = self._sequence()
+        slot = (sequence // 2) % self.capacity
+        struct.pack_into("Q", self.shm.buf, sequenceOffset, sequence + 1) # odd: write in progress
+        struct.pack_into(self.slot_format, self.shm.buf, self.data_offset + slot * self.slot_size, *values)
+        struct.pack_into("Q", self.shm.buf, sequenceOffset, sequence + 2)
+
+    def latest(self):
+        '''
+        Return the newest sample as a dictionary (timestamp and one entry per channel), or None if empty
+        '''
+        rows = self.window(1)
+        if not rows:
+            return None
+        return dict(zip(["timestamp"] + self.channels, rows[0]))
+
+    def window(self, n):
+        '''
+        Return the newest n samples (or fewer, if not written yet), oldest first, as tuples of
+        (timestamp, value per channel). The samples are copied; see windowViews() to read them in place.
+        '''
+        while True:
+            views, sequence = self.windowViews(n)
+            rows = [tuple(row) for view in views for row in view.tolist()]
+            for view in views:
+                view.release()
+            if self.unchanged(sequence, len(rows)):
+                return rows
+
+    def windowViews(self, n):
+        '''
+        Zero-copy access to the newest n samples (or fewer, if not written yet). Returns (views, sequence):
+
+        - views: one memoryview of shape (samples, 1 + number of channels) of float64, oldest first, or two when
+          the samples wrap around the end of the ring (e.g. numpy.concatenate(views) gives a single array)
+        - sequence: the ring's sequence when the views were taken
+
+        The slots are read in place, so the writer may overwrite them meanwhile: after reading, check
+        unchanged(sequence, samples), and read again if it returns False. Release the views before close().
+        '''
+        n = min(n, self.capacity - 1) # one slot may be being written at any time
+        while True:
+            sequence = self._sequence()
+            if sequence % 2:
+                continue # a write is in progress; it is only a few microseconds long
+            count = sequence // 2
+            start = max(count - n, 0)
+            first, last = start % self.capacity, (count - 1) % self.capacity + 1
+            slots = self.view()
+            if count == start:
+                views = []
+            elif first < last:
+                views = [slots[first:last]]
+            else:
+                views = [slots[first:], slots[:last]] # wraps around the end of the ring
+            slots.release()
+            if self.unchanged(sequence, count - start):
+                return views, sequence
+            for view in views:
+                view.release()
+
+    def unchanged(self, sequence, n):
+        '''
+        True if the writer hasn't started overwriting any of the newest n samples as of the given sequence
+        (see windowViews())
+        '''
+        writes = (self._sequence() - sequence + 1) // 2 # including a write still in progress
+        return 0 <= writes <= self.capacity - n
+
+    def view(self):
+        '''
+        Zero-copy access to the ring's slots as a memoryview of shape (capacity, 1 + number of channels) of
+        float64, e.g. for numpy.asarray(). The caller is responsible for checking the sequence (see
+        windowViews(), which does this for the newest samples), and must release the view before calling close().
+        '''
+        return self.shm.buf[self.data_offset:self.data_offset + self.capacity * self.slot_size] \
+                   .cast("d", [self.capacity, self.width])
+
+    def close(self):
+        '''
+        Detach from the ring. The writer also stops publishing, and removes the shared memory block.
+        '''
+        if self.sphero is not None:
+            self.sphero.removeSensorListener(self.write)
+            self.sphero = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def _sequence(self):
+        return struct.unpack_from("Q", self.shm.buf, sequenceOffset)[0]
@@ -0,0 +1,245 @@
+'''
+Formation control for groups of Sphero Minis. Requires numpy (pip install numpy --user).
+
+FormationController keeps the target position and estimated position of every robot in numpy arrays. On each
+tick it computes all robots' roll commands in one vectorized step: each robot is steered towards its target,
+and pushed away from any robot closer than a minimum spacing. The roll packets for the whole group are then
+encoded in bulk, and sent to every connection at the same time, so one slow acknowledgement doesn't hold up
+the others:
+
+    controller = FormationController(spheros, spacing = 0.25)
+    controller.setTargets([[0, 0], [0.5, 0], [0, 0.5], [0.5, 0.5]]) # metres
+    while not controller.arrived():
+        timing = controller.tick()
+        time.sleep(0.1)
+
+Positions are in metres, in the frame of the robots' shared zero heading (see sphero_aim.py): heading 0 drives
+along +y, and headings increase clockwise. The Sphero Mini can't report its position, so the controller
+dead-reckons it from the commanded speeds and headings (speed_scale converts roll speed units to metres per
+second). This drifts; pass measured positions (e.g. from a camera) to setPoses() whenever available.
+
+Run this file directly for a benchmark of per-tick compute and dispatch time as the number of robots grows,
+using simulated connections.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import numpy as np
+import time
+
+from sphero_constants import *
+
+class FormationController():
+    def __init__(self, spheros, spacing = 0.2, gain = 1.5, max_speed = 0.5, speed_scale = 0.004,
+                 arrive_radius = 0.03, repulsion = 1.0, poses = None):
+        '''
+        spheros: connected sphero_mini instances (with a common zero heading)
+        spacing: robots closer than this (metres) push each other apart
+        gain: commanded velocity per metre of distance to the target (1/s)
+        max_speed: fastest commanded velocity (metres per second)
+        speed_scale: metres per second per unit of roll speed (calibrate for your floor and robots)
+        arrive_radius: robots within this distance of their target stop (metres)
+        repulsion: strength of the spacing push (metres per second at zero distance)
+        poses: initial positions, shape (N, 2) (defaults to the first targets set, i.e. everyone starts in place)
+        '''
+        self.spheros = list(spheros)
+        n = len(self.spheros)
+        self.spacing = spacing
+        self.gain = gain
+        self.max_speed = max_speed
+        self.speed_scale = speed_scale
+        self.arrive_radius = arrive_radius
+        self.repulsion = repulsion
+
+        self.targets = np.zeros((n, 2))
+        self.poses = None if poses is None else np.array(poses, dtype = float).reshape(n, 2)
+        self.velocity = np.zeros((n, 2)) # last commanded velocity (m/s), for dead reckoning
+        self.headings = np.zeros(n, dtype = int) # last commanded headings (kept while stopped, to avoid turning)
+        self.last_tick = None
+        self.timings = deque(maxlen = 1000) # per-tick timing dictionaries (see tick())
+        self.executor = ThreadPoolExecutor(max_workers = max(n, 1))
+
+    def setTargets(self, targets):
+        '''
+        Set every robot's target position, shape (N, 2)
+        '''
+        self.targets = np.array(targets, dtype = float).reshape(len(self.spheros), 2)
+        if self.poses is None:
+            self.poses = self.targets.copy()
+
+    def setPoses(self, poses):
+        '''
+        Replace the dead-reckoned positions with measured ones, shape (N, 2)
+        '''
+        self.poses = np.array(poses, dtype = float).reshape(len(self.spheros), 2)
+
+    def arrived(self):
+        return bool(np.all(np.linalg.norm(self.targets - self.poses, axis = 1) <= self.arrive_radius))
+
+    def computeCommands(self):
+        '''
+        Compute every robot's roll command from the current targets and poses. Returns (speeds, headings) as
+        integer arrays of shape (N,), in the units of sphero_mini.roll().
+        '''
+        # Attraction towards the target, limited to max_speed:
+        error = self.targets - self.poses
+        distance = np.linalg.norm(error, axis = 1)
+        velocity = self.gain * error
+        velocity[distance <= self.arrive_radius] = 0
+
+        # Repulsion from every robot within spacing, growing linearly as they get closer:
+        offsets = self.poses[:, None, :] - self.poses[None, :, :] # (N, N, 2): from robot j to robot i
+        separation = np.linalg.norm(offsets, axis = 2)
+        np.fill_diagonal(separation, np.inf)
+        strength = self.repulsion * np.clip(1 - separation / self.spacing, 0, None)
+        velocity += np.sum(strength[:, :, None] * offsets / np.maximum(separation, 1e-6)[:, :, None], axis = 1)
+
+        norm = np.linalg.norm(velocity, axis = 1)
+        velocity *= np.minimum(1, self.max_speed / np.maximum(norm, 1e-9))[:, None]
+        speeds = np.minimum(np.round(np.linalg.norm(velocity, axis = 1) / self.speed_scale), 255).astype(int)
+
+        moving = speeds > 0
+        self.headings[moving] = np.round(np.degrees(np.arctan2(velocity[moving, 0], velocity[moving, 1]))).astype(int) % 360
+
+        # Dead reckon with what the robots will actually do: the rounded speed along the rounded heading
+        radians = np.radians(self.headings)
+        self.velocity = (speeds * self.speed_scale)[:, None] * np.stack((np.sin(radians), np.cos(radians)), axis = 1)
+        return speeds, self.headings.copy()
+
+    def encodeRollPackets(self, speeds, headings, sequences):
+        '''
+        Build the roll packets for all robots at once (the same bytes as sphero_mini.roll() sends), as an
+        array of shape (N, 11) of uint8. See sphero_mini._send() for the packet structure.
+        '''
+        n = len(speeds)
+        packets = np.empty((n, 11), dtype = np.int64)
+        packets[:, 0] = sendPacketConstants["StartOfPacket"]
+        packets[:, 1] = flags["resetsInactivityTimeout"] + flags["requestsResponse"]
+        packets[:, 2] = deviceID['driving']
+        packets[:, 3] = drivingCommands["driveWithHeading"]
+        packets[:, 4] = sequences
+        packets[:, 5] = speeds & 0xFF
+        packets[:, 6] = (headings & 0xFF00) >> 8
+        packets[:, 7] = headings & 0xFF
+        packets[:, 8] = (speeds & 0xFF00) >> 8
+        packets[:, 9] = 0xFF - (np.sum(packets[:, 1:9], axis = 1) & 0xFF) # checksum
+        packets[:, 10] = sendPacketConstants["EndOfPacket"]
+        return packets.astype(np.uint8)
+
+    def tick(self):
+        '''
+        Advance the dead-reckoned poses, compute and send every robot's roll command. Returns a timing dictionary:
+
+        - 'robots': number of robots
+        - 'compute': seconds spent computing and encoding the commands
+        - 'dispatch': seconds until every robot acknowledged (or timed out)
+        - 'acknowledged': number of robots that acknowledged
+        '''
+        self._advancePoses()
+
+        start = time.perf_counter()
+        speeds, headings = self.computeCommands()
+        sequences = [sphero._nextSequence() for sphero in self.spheros]
+        packets = self.encodeRollPackets(speeds, headings, sequences)
+        computed = time.perf_counter()
+
+        acknowledged = self._dispatch(packets, sequences)
+        timing = {"robots": len(self.spheros),
+                  "compute": computed - start,
+                  "dispatch": time.perf_counter() - computed,
+                  "acknowledged": acknowledged}
+        self.timings.append(timing)
+        return timing
+
+    def stop(self):
+        '''
+        Stop every robot now: send speed 0 with its last heading, bypassing the controller (whose spacing push
+        would keep close robots moving). Returns the number of robots that acknowledged.
+        '''
+        self._advancePoses()
+        self.velocity = np.zeros((len(self.spheros), 2))
+        sequences = [sphero._nextSequence() for sphero in self.spheros]
+        packets = self.encodeRollPackets(np.zeros(len(self.spheros), dtype = int), self.headings, sequences)
+        return self._dispatch(packets, sequences)
+
+    def _advancePoses(self):
+        '''
+        Dead reckon the poses up to now, with the velocities commanded last
+        '''
+        now = time.monotonic()
+        if self.last_tick is not None:
+            self.poses += self.velocity * (now - self.last_tick)
+        self.last_tick = now
+
+    def _dispatch(self, packets, sequences):
+        '''
+        Send every robot its packet at the same time, and return the number of robots that acknowledged
+        '''
+        def dispatch(i):
+            sphero = self.spheros[i]
+            sphero._sendPacket(sphero.API_V2_characteristic, packets[i].tobytes(), sequences[i])
+            # Not retried, since the next tick sends a fresh command anyway, so don't wait longer than a retry would:
+            return sphero.getAcknowledgement("Roll", timeout = sphero.link.rto)
+
+        return sum(1 for ok in self.executor.map(dispatch, range(len(self.spheros))) if ok)
+
+    def close(self):
+        self.executor.shutdown()
+
+class SimulatedLink():
+
+    '''
+    Stand-in for sphero_mini.LinkStats, with a fixed retransmission timeout
+    '''
+
+    rto = 1.0
+
+class SimulatedSphero():
+
+    '''
+    Stand-in for a sphero_mini connection, used by benchmark(): accepts roll packets and acknowledges them
+    after a fixed round-trip time
+    '''
+
+    def __init__(self, rtt = 0.03):
+        self.rtt = rtt
+        self.sequence = 1
+        self.API_V2_characteristic = None
+        self.link = SimulatedLink()
+
+    def _nextSequence(self):
+        seq = self.sequence
+        self.sequence = (self.sequence + 1) % 256
+        return seq
+
+    def _sendPacket(self, characteristic, packet, seq):
+        self.packet = packet
+
+    def getAcknowledgement(self, ack, timeout = None):
+        time.sleep(self.rtt)
+        return True
+
+def benchmark(sizes = (4, 16, 64, 256), ticks = 20, rtt = 0.03):
+    '''
+    Average per-tick compute and dispatch time for increasing numbers of (simulated) robots, starting
+    scattered around a grid formation. Returns a list of (robots, compute seconds, dispatch seconds).
+    '''
+    rng = np.random.default_rng(0)
+    results = []
+    for n in sizes:
+        side = int(np.ceil(np.sqrt(n)))
+        grid = np.stack(np.meshgrid(np.arange(side), np.arange(side)), axis = 2).reshape(-1, 2)[:n] * 0.3
+        controller = FormationController([SimulatedSphero(rtt) for _ in range(n)],
+                                         poses = grid + rng.normal(0, 0.2, (n, 2)))
+        controller.setTargets(grid)
+        for _ in range(ticks):
+            controller.tick()
+        controller.close()
+        timings = list(controller.timings)
+        results.append((n, np.mean([t["compute"] for t in timings]), np.mean([t["dispatch"] for t in timings])))
+    return results
+
+if __name__ == "__main__":
+    print("Simulated round-trip time per command: 30ms")
+    for n, compute, dispatch in benchmark():
+        print("{:4d} robots: compute {:7.3f}ms, dispatch {:7.1f}ms per tick".format(n, compute * 1000, dispatch * 1000))
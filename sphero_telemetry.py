@@ -0,0 +1,258 @@
+'''
+Decimated live telemetry for dashboards.
+
+Pushing every sensor sample to a user interface is too much, and naive downsampling (keeping every n-th sample)
+hides short spikes such as collisions. TelemetryView summarises the sensor stream into time buckets at several
+resolutions as the samples arrive. Each bucket keeps the minimum, maximum and mean of each channel, plus one
+representative sample picked in the style of the Largest-Triangle-Three-Buckets (LTTB) algorithm. LTTB keeps
+the sample that deviates most from the line through its neighbours, so spikes survive.
+
+A query such as "the last 60 s at 500 points" is answered from the resolution closest to 60 s / 500, so its
+cost depends on the number of points requested and not on the sample rate:
+
+    view = TelemetryView()
+    view.attach(sphero)
+    ...
+    data = view.series("IMU_acc_x", duration = 60, points = 500)
+    plot(data["t"], data["min"], data["max"], data["mean"], data["lttb"])
+
+Times are host times (time.monotonic(), the 'timestamp' of each sample).
+'''
+
+import threading
+import math
+import time
+
+# Sample dictionary entries that are timing information rather than sensor channels
+timingKeys = ("timestamp", "device_time", "latency")
+
+class Bucket():
+
+    '''
+    Summary of the samples of one channel that fall in one time bucket
+    '''
+
+    __slots__ = ("index", "count", "total", "vmin", "tmin", "vmax", "tmax", "rep")
+
+    def __init__(self, index, t, value):
+        self.index = index
+        self.count = 1
+        self.total = value
+        self.vmin = self.vmax = value
+        self.tmin = self.tmax = t
+        self.rep = None # (t, value) representative sample, once chosen
+
+    def add(self, t, value):
+        self.count += 1
+        self.total += value
+        if value < self.vmin:
+            self.vmin, self.tmin = value, t
+        if value > self.vmax:
+            self.vmax, self.tmax = value, t
+
+    def mean(self):
+        return self.total / self.count
+
+class Level():
+
+    '''
+    Ring of the most recent buckets of one width, for every channel
+    '''
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.rings = {} # channel -> list of Bucket (or None), indexed by bucket index modulo capacity
+        self.pending = {} # channel -> closed bucket whose representative waits on the next bucket's mean
+        self.anchor = {} # channel -> representative of the bucket before the pending one
+        self.open = {} # channel -> bucket currently being filled
+
+    def add(self, channel, t, value):
+        index = math.floor(t / self.width)
+        ring = self.rings.get(channel)
+        if ring is None:
+            ring = self.rings[channel] = [None] * self.capacity
+        bucket = self.open.get(channel)
+        if bucket is not None and bucket.index == index:
+            bucket.add(t, value)
+            return
+        if bucket is not None and index < bucket.index:
+            return # out of order sample for an earlier bucket: already summarised
+        if bucket is not None:
+            self._close(channel, bucket)
+        self.open[channel] = ring[index % self.capacity] = Bucket(index, t, value)
+
+    def _close(self, channel, bucket):
+        '''
+        LTTB picks each bucket's representative using the one chosen before it and the mean of the one after,
+        so a bucket's representative is final once the following bucket has closed.
+        '''
+        pending = self.pending.get(channel)
+        if pending is not None:
+            pending.rep = self.pick(pending, self.anchor.get(channel), self.centre(bucket))
+            self.anchor[channel] = pending.rep
+        self.pending[channel] = bucket
+
+    def centre(self, bucket):
+        return ((bucket.index + 0.5) * self.width, bucket.mean())
+
+    def representative(self, channel, bucket):
+        if bucket.rep is not None:
+            return bucket.rep
+        # Not final yet (one of the two most recent buckets): pick against the bucket's own mean
+        return self.pick(bucket, self.anchor.get(channel), self.centre(bucket))
+
+    def buckets(self, channel, first, last):
+        '''
+        Buckets of a channel with first <= index <= last, oldest first (only those still in the ring)
+        '''
+        ring = self.rings.get(channel)
+        if ring is None:
+            return []
+        first = max(first, last - self.capacity + 1)
+        found = []
+        for index in range(first, last + 1):
+            bucket = ring[index % self.capacity]
+            if bucket is not None and bucket.index == index:
+                found.append(bucket)
+        return found
+
+    @staticmethod
+    def pick(bucket, previous, following):
+        '''
+        Choose between a bucket's minimum and maximum samples: the one forming the largest triangle with the
+        previous representative and the following point (or the one furthest from the mean, at the start)
+        '''
+        candidates = ((bucket.tmin, bucket.vmin), (bucket.tmax, bucket.vmax))
+        if previous is None:
+            mean = bucket.mean()
+            return max(candidates, key = lambda c: abs(c[1] - mean))
+        (ta, va), (tc, vc) = previous, following
+        return max(candidates, key = lambda c: abs((ta - tc) * (c[1] - va) - (ta - c[0]) * (vc - va)))
+
+class TelemetryView():
+    def __init__(self, channels = None, resolutions = (0.01, 0.1, 1.0, 10.0), capacity = 4096):
+        '''
+        channels: names of the sample entries to keep (defaults to every sensor channel in the stream)
+        resolutions: bucket widths in seconds, one level each. Consecutive widths should differ by a
+                constant factor (10 by default), which bounds the work per query to points * factor buckets.
+        capacity: buckets kept per level and channel. The coarsest level covers resolution * capacity seconds
+                (over 11 hours by default).
+        '''
+        self.channels = channels
+        self.levels = [Level(width, capacity) for width in sorted(resolutions)]
+        self.lock = threading.Lock() # queries typically come from another thread than the sensor stream
+        self.latest = None
+        self.sphero = None
+
+    def attach(self, sphero):
+        '''
+        Consume the sensor stream of a sphero_mini instance
+        '''
+        self.sphero = sphero
+        sphero.addSensorListener(self.addSample)
+
+    def detach(self):
+        if self.sphero is not None:
+            self.sphero.removeSensorListener(self.addSample)
+            self.sphero = None
+
+    def addSample(self, sample):
+        '''
+        Add one decoded sample (see sphero_mini.addSensorListener())
+        '''
+        names = self.channels or [name for name in sample if name not in timingKeys]
+        self.add(sample["timestamp"], {name: sample[name] for name in names if name in sample})
+
+    def add(self, t, values):
+        '''
+        Add values (a dictionary of channel name -> number) measured at host time t. Other values, e.g. from
+        sphero_fusion or sphero_detector, can be added alongside the sensor stream this way.
+        '''
+        with self.lock:
+            for name, value in values.items():
+                for level in self.levels:
+                    level.add(name, t, value)
+            self.latest = t if self.latest is None else max(self.latest, t)
+
+    def series(self, channel, duration = 60, points = 500, now = None):
+        '''
+        Return about `points` points covering the last `duration` seconds of a channel, as a dictionary of lists:
+
+        - 't': start time of each point's interval
+        - 'min', 'max', 'mean': summary of the samples within each point's interval
+        - 'lttb': list of (t, value) samples chosen to preserve the shape of the signal (including spikes)
+        - 'resolution': bucket width of the level the points were built from (seconds)
+
+        now: end of the interval (defaults to the latest sample time)
+        '''
+        with self.lock:
+            if now is None:
+                now = self.latest if self.latest is not None else time.monotonic()
+            level = self._level(duration, points)
+            buckets = level.buckets(channel, math.floor((now - duration) / level.width), math.floor(now / level.width))
+            reps = [level.representative(channel, bucket) for bucket in buckets]
+
+        result = {"t": [], "min": [], "max": [], "mean": [], "lttb": lttb(reps, points), "resolution": level.width}
+        if not buckets:
+            return result
+
+        # Merge neighbouring buckets into `points` intervals of equal length:
+        start = now - duration
+        span = duration / points
+        group = None
+        for bucket in buckets:
+            g = min(int(max(bucket.index * level.width - start, 0) / span), points - 1)
+            if g != group:
+                group = g
+                result["t"].append(start + g * span)
+                result["min"].append(bucket.vmin)
+                result["max"].append(bucket.vmax)
+                result["mean"].append([bucket.total, bucket.count])
+            else:
+                result["min"][-1] = min(result["min"][-1], bucket.vmin)
+                result["max"][-1] = max(result["max"][-1], bucket.vmax)
+                result["mean"][-1][0] += bucket.total
+                result["mean"][-1][1] += bucket.count
+        result["mean"] = [total / count for total, count in result["mean"]]
+        return result
+
+    def channelNames(self):
+        with self.lock:
+            return list(self.levels[0].rings)
+
+    def _level(self, duration, points):
+        '''
+        The coarsest level that still gives at least `points` buckets over `duration`, among the levels that
+        keep that much history (or else the coarsest level)
+        '''
+        covering = [level for level in self.levels if level.width * level.capacity >= duration] or self.levels[-1:]
+        fine_enough = [level for level in covering if level.width <= duration / points]
+        return fine_enough[-1] if fine_enough else covering[0]
+
+def lttb(data, threshold):
+    '''
+    Largest-Triangle-Three-Buckets downsampling of a list of (t, value) points to `threshold` points
+    (Sveinn Steinarsson, 2013)
+    '''
+    if threshold >= len(data) or threshold < 3:
+        return list(data)
+    sampled = [data[0]]
+    every = (len(data) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket, as the third corner of the triangle:
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, len(data))
+        avg_t = sum(p[0] for p in data[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_v = sum(p[1] for p in data[avg_start:avg_end]) / (avg_end - avg_start)
+
+        ta, va = data[a]
+        best, best_area = None, -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ta - avg_t) * (data[j][1] - va) - (ta - data[j][0]) * (avg_v - va))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(data[best])
+        a = best
+    sampled.append(data[-1])
+    return sampled
@@ -0,0 +1,121 @@
+'''
+Tests of sphero_discovery against a stand-in bluetooth scanner (no hardware needed):
+
+    python -m unittest test_sphero_discovery
+'''
+
+from unittest import mock
+import unittest
+import io
+
+from bluepy.btle import ScanEntry, BTLEManagementError
+import sphero_discovery
+
+class FakeEntry():
+
+    '''
+    Stand-in for bluepy's ScanEntry
+    '''
+
+    def __init__(self, addr, rssi, name = None, services = None):
+        self.addr = addr
+        self.rssi = rssi
+        self.values = {ScanEntry.COMPLETE_LOCAL_NAME: name, ScanEntry.COMPLETE_128B_SERVICES: services}
+
+    def getValueText(self, adtype):
+        return self.values.get(adtype)
+
+class FakeScanner():
+
+    '''
+    Stand-in for bluepy's Scanner: returns the entries set in self.entries, or raises self.error
+    '''
+
+    def __init__(self, entries = (), error = None):
+        self.entries = list(entries)
+        self.error = error
+        self.scans = 0
+
+    def scan(self, timeout):
+        self.scans += 1
+        if self.error is not None:
+            raise self.error
+        return list(self.entries)
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestSpheroScanner(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("sphero_discovery.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_finds_spheros_by_name_or_service(self):
+        scanner = FakeScanner([FakeEntry("aa", -60, name = "SM-A4B1"),
+                               FakeEntry("bb", -40, services = sphero_discovery.serviceUUID.upper()),
+                               FakeEntry("cc", -30, name = "Headphones")])
+        devices = sphero_discovery.SpheroScanner(scanner).scan()
+        self.assertEqual([device.addr for device in devices], ["bb", "aa"]) # strongest signal first
+        self.assertEqual(devices[1].name, "SM-A4B1")
+
+    def test_cached_within_ttl(self):
+        scanner = FakeScanner([FakeEntry("aa", -60, name = "SM-A4B1")])
+        spheros = sphero_discovery.SpheroScanner(scanner, ttl = 30)
+        spheros.scan()
+        self.clock.now += 10
+        self.assertEqual(len(spheros.scan()), 1)
+        self.assertEqual(scanner.scans, 1)
+        spheros.scan(refresh = True)
+        self.assertEqual(scanner.scans, 2)
+
+    def test_ttl_expiry(self):
+        scanner = FakeScanner([FakeEntry("aa", -60, name = "SM-A4B1")])
+        spheros = sphero_discovery.SpheroScanner(scanner, ttl = 30)
+        spheros.scan()
+        scanner.entries = [] # the sphero has gone
+        self.clock.now += 31
+        self.assertEqual(spheros.scan(), [])
+        self.assertEqual(scanner.scans, 2)
+
+    def test_min_rssi(self):
+        scanner = FakeScanner([FakeEntry("aa", -85, name = "SM-A4B1"), FakeEntry("bb", -50, name = "SM-0C2D")])
+        devices = sphero_discovery.SpheroScanner(scanner).scan(min_rssi = -80)
+        self.assertEqual([device.addr for device in devices], ["bb"])
+
+    def test_scan_error(self):
+        scanner = FakeScanner(error = BTLEManagementError("Failed to execute management command 'le on'"))
+        spheros = sphero_discovery.SpheroScanner(scanner)
+        with mock.patch("sys.stderr", new_callable = io.StringIO) as stderr:
+            self.assertEqual(spheros.scan(), [])
+            spheros.scan() # a failed scan isn't cached
+        self.assertIn("sudo", stderr.getvalue())
+        self.assertEqual(scanner.scans, 2)
+
+class TestConnectAll(unittest.TestCase):
+    def test_retries(self):
+        attempts = {}
+        def connect(addr, **kwargs):
+            attempts[addr] = attempts.get(addr, 0) + 1
+            if addr == "bad" or attempts[addr] == 1: # "good" fails on its first attempt only
+                raise RuntimeError("connection failed")
+            return (addr, kwargs)
+
+        devices = [sphero_discovery.DiscoveredSphero("good", "SM-A4B1", -50, 0), "bad"]
+        with mock.patch("sys.stderr", new_callable = io.StringIO):
+            spheros, failed = sphero_discovery.connectAll(devices, retries = 2, connect = connect, verbosity = 1)
+        self.assertEqual(spheros, {"good": ("good", {"verbosity": 1})})
+        self.assertEqual(list(failed), ["bad"])
+        self.assertIsInstance(failed["bad"], RuntimeError)
+        self.assertEqual(attempts, {"good": 2, "bad": 3})
+
+    def test_nothing_to_connect(self):
+        self.assertEqual(sphero_discovery.connectAll([]), ({}, {}))
+
+if __name__ == "__main__":
+    unittest.main()
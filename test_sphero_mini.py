@@ -0,0 +1,71 @@
+'''
+Tests of the link bookkeeping in sphero_mini (no hardware needed):
+
+    python -m unittest test_sphero_mini
+'''
+
+import unittest
+import random
+
+from sphero_mini import LinkStats, ClockSync
+
+class TestSensorFrames(unittest.TestCase):
+    def frames(self, device_times):
+        link = LinkStats()
+        for device_time in device_times:
+            link.sensorFrame(device_time)
+        return link
+
+    def test_in_order(self):
+        link = self.frames([0.1, 0.2, 0.3, 0.4])
+        self.assertEqual((link.sensor_frames, link.dropped_sensor_frames, link.reordered_sensor_frames), (4, 0, 0))
+
+    def test_gap(self):
+        link = self.frames([0.1, 0.2, 0.3, 0.6, 0.7])
+        self.assertEqual((link.dropped_sensor_frames, link.reordered_sensor_frames), (2, 0))
+
+    def test_late_frame_is_not_dropped(self):
+        link = self.frames([0.1, 0.2, 0.4, 0.3])
+        self.assertEqual((link.dropped_sensor_frames, link.reordered_sensor_frames), (0, 1))
+
+    def test_late_frame_inside_longer_gap(self):
+        link = self.frames([0.1, 0.2, 0.3, 0.6, 0.4, 0.7])
+        self.assertEqual((link.dropped_sensor_frames, link.reordered_sensor_frames), (1, 1)) # 0.5 is still missing
+
+    def test_late_frame_outside_gap(self):
+        link = self.frames([0.1, 0.2, 0.3, 0.4, 0.2])
+        self.assertEqual((link.dropped_sensor_frames, link.reordered_sensor_frames), (0, 1))
+
+class TestClockSync(unittest.TestCase):
+    def test_offset_and_drift_under_jitter(self):
+        rng = random.Random(0)
+        offset, drift, min_delay = 1234.5, 40e-6, 0.02
+        clock = ClockSync()
+        for i in range(600): # one minute at 10 samples per second
+            device_time = 100.0 + i * 0.1
+            delay = min_delay + rng.expovariate(1 / 0.03) # jitter with a mean of 30ms above the minimum
+            clock.update(device_time, offset + (1 + drift) * device_time + delay)
+
+        # The fit follows the fastest samples, so the minimum delay is part of the offset:
+        self.assertAlmostEqual(clock.drift, drift, delta = 10e-6)
+        self.assertAlmostEqual(clock.toHostTime(160.0), offset + (1 + drift) * 160.0 + min_delay, delta = 0.002)
+        host_time = offset + (1 + drift) * 160.0 + min_delay + 0.05
+        self.assertAlmostEqual(clock.latency(160.0, host_time), 0.05, delta = 0.002)
+
+    def test_drift_limited(self):
+        clock = ClockSync(max_drift = 0.001)
+        for i in range(300):
+            clock.update(i * 0.1, i * 0.1 * 1.01) # a 1% rate difference isn't a real clock
+        self.assertEqual(clock.drift, 0.001)
+
+    def test_no_drift_from_short_window(self):
+        clock = ClockSync(min_span = 10.0)
+        clock.update(0.0, 5.0)
+        clock.update(0.1, 5.2)
+        clock.update(0.2, 5.2)
+        clock.update(0.3, 5.3)
+        self.assertEqual(clock.drift, 0.0)
+        self.assertAlmostEqual(clock.toHostTime(0.0), 5.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+'''
+Tests of sphero_scheduler against a stand-in sphero (no hardware needed):
+
+    python -m unittest test_sphero_scheduler
+'''
+
+import threading
+import unittest
+import time
+
+from sphero_scheduler import CommandScheduler
+
+class FakeLink():
+    rto = 0.1
+
+class FakeSphero():
+
+    '''
+    Stand-in for a sphero_mini connection whose battery voltage response never arrives: the request waits for
+    its full timeout (10 seconds by default, like getAcknowledgement())
+    '''
+
+    def __init__(self):
+        self.p = self
+        self.link = FakeLink()
+        self.firmware_version = [0, 12, 0]
+        self.battery_timeouts = []
+        self.battery_polled = threading.Event()
+        self.rolls = []
+
+    def waitForNotifications(self, timeout):
+        time.sleep(timeout)
+
+    def getBatteryVoltage(self, timeout = None):
+        self.battery_timeouts.append(timeout)
+        self.battery_polled.set()
+        time.sleep(10 if timeout is None else timeout) # no acknowledgement: wait until the timeout
+
+    def roll(self, speed, heading):
+        self.rolls.append((time.monotonic(), speed, heading))
+
+class TestTelemetryPolling(unittest.TestCase):
+    def test_lost_battery_response_doesnt_hold_drive(self):
+        sphero = FakeSphero()
+        scheduler = CommandScheduler(sphero, telemetry_interval = 60, idle_time = 0)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+
+        self.assertTrue(sphero.battery_polled.wait(1))
+        queued = time.monotonic()
+        scheduler.roll(100, 90).result(timeout = 2)
+
+        self.assertEqual(sphero.battery_timeouts, [sphero.link.rto])
+        self.assertEqual(sphero.rolls[0][1:], (100, 90))
+        self.assertLess(sphero.rolls[0][0] - queued, sphero.link.rto + 0.1)
+
+    def test_no_polling_while_busy(self):
+        sphero = FakeSphero()
+        scheduler = CommandScheduler(sphero, telemetry_interval = 60, idle_time = 0.5)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        for _ in range(10):
+            scheduler.roll(50, 0)
+            time.sleep(0.02)
+        self.assertFalse(sphero.battery_polled.is_set())
+
+if __name__ == "__main__":
+    unittest.main()